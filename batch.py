@@ -0,0 +1,766 @@
+import random
+import numpy as np
+from constants import *
+from modes import MODESCHEDULE
+from nodes import NodeGroup, SPAWNNODE, PACMANSTART, FRUITSTART, BLINKYSTART, PINKYSTART, INKYSTART, CLYDESTART
+from pellets import PelletGroup
+from levels import LevelController
+from mazecache import MazeCache
+
+# Directions and actions use the integer direction constants.  An action of
+# STOP means no key is pressed and Pac-Man keeps moving on his own.
+VECTORTABLE = np.array([v.asTuple() for v in VECTORS], dtype=float)
+OPPOSITETABLE = np.array(OPPOSITE, dtype=np.int32)
+
+SCATTER, CHASE, FREIGHT, SPAWN, GUIDE = range(5)
+MODENAMES = ["SCATTER", "CHASE", "FREIGHT", "SPAWN", "GUIDE"]
+
+NOPAUSE, DIEPAUSE, CLEARPAUSE = range(3)
+
+# One entry per ghost in GhostGroup order (Blinky, Pinky, Inky, Clyde).
+GHOSTS = [
+    {"start":BLINKYSTART, "scatter":(SCREENSIZE[0], 0), "release":0,
+     "banned":[], "guide":[UP], "homeSpawn":False},
+    {"start":PINKYSTART, "scatter":(0, 0), "release":0,
+     "banned":[], "guide":[UP], "homeSpawn":False},
+    {"start":INKYSTART, "scatter":(TILEWIDTH*NCOLS, TILEHEIGHT*NROWS), "release":30,
+     "banned":[RIGHT], "guide":[UP, RIGHT], "homeSpawn":True},
+    {"start":CLYDESTART, "scatter":(0, TILEHEIGHT*NROWS), "release":60,
+     "banned":[LEFT], "guide":[UP, LEFT], "homeSpawn":True}]
+BLINKY, PINKY, INKY, CLYDE = range(4)
+
+# Pac-Man and the ghosts share one set of movement arrays: column 0 is
+# Pac-Man and column j+1 is ghost j.
+PACMAN = 0
+ENTITIES = 1 + len(GHOSTS)
+
+PACMANSPEED = 100
+GHOSTSPEED = 100
+PORTALSPEED = 50
+COLLIDERADIUS = 5
+FRUITLIFESPAN = 5
+FRUITPOINTS = 100
+
+# Added to the distance of the way a ghost turns when it has no other.
+LASTRESORT = 1e300
+
+# Frightened ghost goals drawn ahead per game, and the 32 bit words pulled
+# from the game's generator at a time to draw them.
+GOALBUFFER = 128
+GOALBLOCK = 1024
+
+
+def goalStream(rng):
+    """Yields the goals Ghost.randomGoal draws from rng, in order, as arrays.
+
+    randint(0, n) takes the top bits of one 32 bit word and draws again while
+    they come out above n, so whole blocks of words are taken with one
+    getrandbits call and the same choices are made on them here.  Each goal
+    is the next word that passes for x followed by the next one after it
+    that passes for y, so the word after each goal is tabled against the
+    word its draw starts from and the chain of goals is followed by
+    doubling the hops.  Words left over after the last whole goal start
+    the next block.
+    """
+    xLimit, yLimit = NCOLS*TILEWIDTH + 1, NROWS*TILEHEIGHT + 1
+    xShift, yShift = 32 - xLimit.bit_length(), 32 - yLimit.bit_length()
+    words = np.zeros(0, dtype=np.uint32)
+    while True:
+        block = rng.getrandbits(32 * GOALBLOCK).to_bytes(4 * GOALBLOCK, "little")
+        words = np.concatenate((words, np.frombuffer(block, dtype="<u4")))
+        n = len(words)
+        xs, ys = words >> xShift, words >> yShift
+        index = np.arange(n + 2)
+        nextX = index.copy()
+        nextX[:n] = np.where(xs < xLimit, index[:n], n)
+        nextX = np.minimum.accumulate(nextX[::-1])[::-1]
+        nextY = index.copy()
+        nextY[:n] = np.where(ys < yLimit, index[:n], n)
+        nextY = np.minimum.accumulate(nextY[::-1])[::-1]
+        after = np.minimum(nextY[np.minimum(nextX + 1, n + 1)] + 1, n + 1)
+        starts, hop = np.zeros(1, dtype=int), after
+        while hop[0] <= n:
+            starts = np.concatenate((starts, hop[starts]))
+            hop = hop[hop]
+        starts = starts[after[starts] <= n]
+        goals = np.stack((xs[nextX[starts]], ys[after[starts] - 1]), axis=1).astype(float)
+        words = words[after[starts[-1]] if len(starts) > 0 else 0:]
+        yield goals
+
+
+class BatchEngine(object):
+    """Steps many headless games at once.
+
+    Every piece of per-game state lives in a NumPy array with the game index
+    as the first axis, so one call to step() advances all games with the same
+    rules as GameController running headless.  Each frame works on whole
+    arrays under masks; only the few games where something happens, such as
+    an entity reaching a node or a pellet being eaten, are picked out by
+    index.  Each game also keeps its own random.Random, seeded by reset, for
+    the frightened ghosts' goals.
+    """
+    def __init__(self, numGames, levelmap=None, dt=1.0/30, seed=None):
+        if levelmap is None:
+            levelmap = LevelController().getLevel()
+        self.numGames = numGames
+        self.dt = dt
+        self.seeds = random.Random(seed)
+        self.randoms = [random.Random() for i in range(numGames)]
+        self.goalStreams = [None] * numGames
+        self.goalSpares = [None] * numGames
+        compiled = MazeCache().load(levelmap)
+        self.setupGraph(NodeGroup(levelmap["mazename"], compiled.nodeTable))
+        self.setupPellets(PelletGroup(levelmap["pelletname"], compiled.pelletLayout))
+        self.setupGhosts()
+        self.setupDirections()
+        self.allocate()
+        self.reset()
+
+    def setupGraph(self, nodes):
+        nodeList = nodes.nodeList
+        indices = {}
+        for i, node in enumerate(nodeList):
+            indices[node] = i
+        index = indices.get
+        self.numNodes = len(nodeList)
+        self.nodePositions = np.array([node.position.asTuple() for node in nodeList], dtype=float)
+        # The extra STOP column is always empty so lookups never need a guard.
+        self.neighbors = np.full((len(nodeList), 5), -1, dtype=np.int32)
+        self.portals = np.full(len(nodeList), -1, dtype=np.int32)
+        self.homeEntrance = np.zeros(len(nodeList), dtype=bool)
+        for i, node in enumerate(nodeList):
+            for d in range(4):
+                neighbor = node.neighbors[d]
+                if neighbor is not None:
+                    self.neighbors[i, d] = index(neighbor)
+            if node.portalNode is not None:
+                self.portals[i] = index(node.portalNode)
+            self.homeEntrance[i] = node.homeEntrance
+        self.portalNodes = self.portals >= 0
+        # The node an entity is on once it reaches each node, after any portal.
+        self.arrivals = np.where(self.portalNodes, self.portals, np.arange(len(nodeList))).astype(np.int32)
+        # Where Pac-Man goes on reaching each target heading each way with
+        # each key held, read at (target * 5 + direction) * 5 + key.  With a
+        # key held he turns onto it if he can, and otherwise goes on the way
+        # he was heading, stopping at a wall.  He cannot turn into the ghost
+        # home.  He is put back on the node unless he goes straight through.
+        node = np.repeat(self.arrivals, 25)
+        direction = np.tile(np.repeat(np.arange(5, dtype=np.int32), 5), len(nodeList))
+        key = np.tile(np.arange(5, dtype=np.int32), 5 * len(nodeList))
+        byKey = np.where(self.homeEntrance[node], -1, self.neighbors[node, key])
+        turn = byKey >= 0
+        target = np.where(turn, byKey, self.neighbors[node, direction])
+        stop = target < 0
+        self.pacmanTargets = np.where(stop, np.repeat(np.arange(len(nodeList)), 25), target).astype(np.int32)
+        self.pacmanDirections = np.where(turn, key, np.where(stop, STOP, direction)).astype(np.int32)
+        self.pacmanSnaps = np.repeat(self.portalNodes, 25) | stop | (turn & (direction != key))
+        # Squared length of the edge from node to target and whether it runs
+        # through a portal, both read at node * numNodes + target.
+        vec = self.nodePositions[None, :, :] - self.nodePositions[:, None, :]
+        self.edgeLengths = (vec[:, :, 0]**2 + vec[:, :, 1]**2).reshape(-1)
+        self.edgePortals = (self.portalNodes[:, None] | self.portalNodes[None, :]).reshape(-1)
+        # The point one tile away from each node in each direction.
+        self.nodeSteps = np.zeros((len(nodeList), 5, 2))
+        self.nodeSteps[:, :4] = self.nodePositions[:, None, :] + VECTORTABLE[None, :4] * TILEWIDTH
+        self.startNodes = {}
+        for flag in [PACMANSTART, FRUITSTART, BLINKYSTART, PINKYSTART, INKYSTART, CLYDESTART]:
+            self.startNodes[flag] = index(nodes.getSpecialNode(flag))
+        self.spawnNode = index(nodes.getSpecialNode(SPAWNNODE))
+
+    def setupPellets(self, pellets):
+        layout = pellets.layout
+        pelletList = [pellets.getPellet(index) for index in layout.indices]
+        self.numPellets = layout.numPellets
+        # A last, never present pellet stands in for empty tiles, so looking
+        # up the tiles around Pac-Man needs no guard.
+        self.pelletPositions = np.zeros((self.numPellets + 1, 2))
+        self.pelletPositions[:-1] = [layout.getPosition(index) for index in layout.indices]
+        self.pelletPoints = np.array([p.points for p in pelletList] + [0], dtype=np.int32)
+        self.pelletReach = np.array([(p.radius + COLLIDERADIUS)**2 for p in pelletList] + [-1], dtype=float)
+        self.powerPellets = np.array([p.name == "powerpellet" for p in pelletList] + [False])
+        self.fruitCounts = np.isin(np.arange(self.numPellets + 1), [70, 140])
+        # Pellet index per tile with a two tile border, so the tiles around
+        # Pac-Man can be read even when he is inside a portal.  Every pellet
+        # he can touch lies in the 2x2 block from the tile he is on, since no
+        # reach is as long as a tile.
+        width = NCOLS + 4
+        self.pelletGrid = np.full((NROWS+4) * width, self.numPellets, dtype=np.int32)
+        for i, index in enumerate(layout.indices):
+            row, col = divmod(index, layout.cols)
+            self.pelletGrid[(row+2) * width + col+2] = i
+        self.gridWidth = width
+        self.pelletOffsets = np.array([0, 1, width, width+1], dtype=np.int32) + 2 * width + 2
+
+    def setupGhosts(self):
+        # Tables indexed by entity column; Pac-Man's entries are never read.
+        starts = [self.startNodes[g["start"]] for g in GHOSTS]
+        spawns = [starts[i] if g["homeSpawn"] else self.spawnNode for i, g in enumerate(GHOSTS)]
+        self.ghostStarts = np.array([0] + starts, dtype=np.int32)
+        self.ghostSpawns = np.array([-1] + spawns, dtype=np.int32)
+        self.ghostScatter = np.array([(0, 0)] + [g["scatter"] for g in GHOSTS], dtype=float)
+        self.ghostRelease = np.array([0] + [g["release"] for g in GHOSTS], dtype=np.int32)
+        self.ghostBannedStart = np.zeros((ENTITIES, 4), dtype=bool)
+        self.ghostBans = np.zeros(ENTITIES, dtype=np.int8)
+        self.ghostGuides = np.full((ENTITIES, 2), STOP, dtype=np.int32)
+        self.ghostGuideLengths = np.array([0] + [len(g["guide"]) for g in GHOSTS], dtype=np.int8)
+        for i, g in enumerate(GHOSTS):
+            for d in g["banned"]:
+                self.ghostBannedStart[i+1, d] = True
+                self.ghostBans[i+1] = i+1
+            self.ghostGuides[i+1, :len(g["guide"])] = g["guide"]
+        # Goals that do not depend on Pac-Man, read at mode * ENTITIES +
+        # column.  A guided ghost keeps the goal it had while spawning.
+        spawnGoals = self.nodePositions[[spawns[0]] + spawns]
+        self.staticGoals = np.zeros((len(MODENAMES), ENTITIES, 2))
+        self.staticGoals[SCATTER] = self.ghostScatter
+        self.staticGoals[SPAWN] = spawnGoals
+        self.staticGoals[GUIDE] = spawnGoals
+        self.staticGoals = self.staticGoals.reshape(-1, 2)
+        # How far ahead of Pac-Man each ghost aims while chasing.  Inky's
+        # goal also depends on Blinky and is worked out on its own.
+        self.chaseAhead = np.array([0, 0, TILEWIDTH*4, 0, TILEWIDTH*4], dtype=float)
+        self.isGhost = np.arange(ENTITIES) != PACMAN
+        # Pac-Man is never slowed in a portal.
+        self.portalSpeeds = np.array([PACMANSPEED] + [PORTALSPEED] * len(GHOSTS), dtype=float)
+        self.normalSpeeds = np.array([PACMANSPEED] + [GHOSTSPEED] * len(GHOSTS), dtype=float)
+        self.scheduleModes = np.array([MODENAMES.index(name) for name, time in MODESCHEDULE], dtype=np.int8)
+        self.scheduleTimes = np.array([np.inf if time is None else time
+                                       for name, time in MODESCHEDULE], dtype=float)
+
+    def setupDirections(self):
+        # The cost added to the distance of each way a ghost can leave a
+        # node, read at ((node * 5 + direction) * 2 + spawning) * ENTITIES +
+        # bans, where bans is the column whose starting bans still hold or 0.
+        # The ways a ghost may not go cost infinity, except turning back (or
+        # staying put when standing still), which is kept as the last resort.
+        node, direction, spawn, bans = [a.reshape(-1) for a in np.meshgrid(
+            np.arange(self.numNodes), np.arange(5), [False, True], np.arange(ENTITIES), indexing="ij")]
+        valid = self.neighbors[node, :4] >= 0
+        valid &= np.arange(4) != OPPOSITETABLE[direction][:, None]
+        entrance = self.homeEntrance[node]
+        valid &= ~((~spawn & ~entrance)[:, None] & self.ghostBannedStart[bans])
+        valid[:, DOWN] &= spawn | ~entrance
+        self.directionCosts = np.full((len(node), 5), np.inf)
+        self.directionCosts[:, :4][valid] = 0
+        self.directionCosts[np.arange(len(node)), OPPOSITETABLE[direction]] = LASTRESORT
+
+    def allocate(self):
+        n, e = self.numGames, ENTITIES
+        self.frames = np.zeros(n, dtype=np.int32)
+        self.score = np.zeros(n, dtype=np.int32)
+        self.lives = np.zeros(n, dtype=np.int32)
+        self.level = np.zeros(n, dtype=np.int32)
+        self.gameover = np.zeros(n, dtype=bool)
+        self.pelletsEaten = np.zeros(n, dtype=np.int32)
+        self.pelletsLeft = np.zeros(n, dtype=np.int32)
+        self.pellets = np.zeros((n, self.numPellets + 1), dtype=bool)
+        self.pelletRows = np.arange(n, dtype=np.int32)[:, None] * (self.numPellets + 1)
+        self.noKeys = np.full(n, STOP, dtype=np.int32)
+
+        self.paused = np.zeros(n, dtype=bool)
+        self.playerPaused = np.zeros(n, dtype=bool)
+        self.playClock = np.zeros(n)
+        self.pauseClock = np.zeros(n)
+        self.pauseDue = np.zeros(n)
+        self.pauseType = np.zeros(n, dtype=np.int8)
+        self.dying = np.zeros(n, dtype=bool)
+
+        self.fruitActive = np.zeros(n, dtype=bool)
+        self.fruitDue = np.zeros(n)
+        self.fruitPosition = np.zeros((n, 2))
+
+        # Movement state of every entity.  Positions and clocks stay float64
+        # so they round exactly like GameController's Python floats.
+        self.node = np.zeros((n, e), dtype=np.int32)
+        self.target = np.zeros((n, e), dtype=np.int32)
+        self.direction = np.full((n, e), STOP, dtype=np.int32)
+        self.position = np.zeros((n, e, 2))
+        self.entityGames = np.repeat(np.arange(n, dtype=np.int32), e)
+        self.entityColumns = np.tile(np.arange(e, dtype=np.int32), n)
+
+        # Ghost state, with a Pac-Man column that never changes so it lines
+        # up with the movement arrays.
+        self.modes = np.zeros((n, e), dtype=np.int8)
+        self.modeTime = np.full((n, e), np.inf)
+        self.modeSpeed = np.ones((n, e))
+        self.modeDirection = np.zeros((n, e), dtype=np.int32)
+        self.modeStart = np.zeros((n, e))
+        self.scheduleIndex = np.zeros((n, e), dtype=np.int8)
+        self.savedMode = np.zeros((n, e), dtype=np.int8)
+        self.savedTime = np.zeros((n, e))
+        self.hasSaved = np.zeros((n, e), dtype=bool)
+        self.guidesLeft = np.zeros((n, e), dtype=np.int8)
+        self.ghostBanned = np.zeros((n, e), dtype=np.int8)
+        self.ghostReleased = np.ones((n, e), dtype=bool)
+        self.ghostPoints = np.zeros(n, dtype=np.int32)
+        self.goals = np.zeros((n * GOALBUFFER, 2))
+        self.goalCursor = np.zeros(n, dtype=np.int32)
+
+        self.pacmanNode = self.node[:, PACMAN]
+        self.pacmanTarget = self.target[:, PACMAN]
+        self.pacmanDirection = self.direction[:, PACMAN]
+        self.pacmanPosition = self.position[:, PACMAN]
+        self.ghostNode = self.node[:, 1:]
+        self.ghostTarget = self.target[:, 1:]
+        self.ghostDirection = self.direction[:, 1:]
+        self.ghostPosition = self.position[:, 1:]
+        self.mode = self.modes[:, 1:]
+
+        # Flat views, indexed by game * ENTITIES + column.
+        self.nodeFlat = self.node.reshape(-1)
+        self.targetFlat = self.target.reshape(-1)
+        self.directionFlat = self.direction.reshape(-1)
+        self.positionFlat = self.position.reshape(-1, 2)
+        self.modesFlat = self.modes.reshape(-1)
+        self.modeTimeFlat = self.modeTime.reshape(-1)
+        self.modeSpeedFlat = self.modeSpeed.reshape(-1)
+        self.modeDirectionFlat = self.modeDirection.reshape(-1)
+        self.modeStartFlat = self.modeStart.reshape(-1)
+        self.scheduleIndexFlat = self.scheduleIndex.reshape(-1)
+        self.savedModeFlat = self.savedMode.reshape(-1)
+        self.savedTimeFlat = self.savedTime.reshape(-1)
+        self.hasSavedFlat = self.hasSaved.reshape(-1)
+        self.guidesLeftFlat = self.guidesLeft.reshape(-1)
+        self.bannedFlat = self.ghostBanned.reshape(-1)
+        self.releasedFlat = self.ghostReleased.reshape(-1)
+
+    def reset(self, games=None, seeds=None):
+        # A game reset with a given seed plays exactly like GameController
+        # after startGame(seed), given the same inputs.
+        games = self.allGames(games)
+        if seeds is None:
+            seeds = [self.seeds.randrange(1 << 32) for game in games]
+        for game, seed in zip(games.tolist(), seeds):
+            self.randoms[game].seed(seed)
+            self.goalStreams[game] = goalStream(self.randoms[game])
+            self.goalSpares[game] = np.zeros((0, 2))
+            self.goalCursor[game] = GOALBUFFER
+        self.fillGoals(games)
+        self.frames[games] = 0
+        self.score[games] = 0
+        self.lives[games] = 5
+        self.level[games] = 0
+        self.gameover[games] = False
+        self.playClock[games] = 0
+        self.pauseClock[games] = 0
+        self.startLevel(games)
+
+    def allGames(self, games):
+        if games is None:
+            return np.arange(self.numGames)
+        games = np.asarray(games)
+        if games.dtype == bool:
+            return np.flatnonzero(games)
+        return games
+
+    def fillGoals(self, games):
+        # Moves the goals not drawn yet to the front of each game's buffer
+        # and tops it up from the game's stream.
+        goals = self.goals.reshape(self.numGames, GOALBUFFER, 2)
+        for game in games.tolist():
+            cursor = int(self.goalCursor[game])
+            left = GOALBUFFER - cursor
+            goals[game, :left] = goals[game, cursor:]
+            spare = self.goalSpares[game]
+            while left < GOALBUFFER:
+                if len(spare) == 0:
+                    spare = next(self.goalStreams[game])
+                count = min(len(spare), GOALBUFFER - left)
+                goals[game, left:left+count] = spare[:count]
+                spare = spare[count:]
+                left += count
+            self.goalSpares[game] = spare
+            self.goalCursor[game] = 0
+
+    def startLevel(self, g):
+        self.pellets[g, :-1] = True
+        self.pelletsLeft[g] = self.numPellets
+        self.pelletsEaten[g] = 0
+        self.restartLevel(g)
+
+    def restartLevel(self, g):
+        self.resetPacman(g)
+        self.resetGhosts(g)
+        self.fruitActive[g] = False
+        self.paused[g] = True
+        self.playerPaused[g] = True
+        self.pauseDue[g] = np.inf
+        self.pauseType[g] = NOPAUSE
+
+    def resetPacman(self, g):
+        start = self.startNodes[PACMANSTART]
+        target = self.neighbors[start, LEFT]
+        self.pacmanDirection[g] = LEFT
+        self.pacmanNode[g] = start
+        self.pacmanTarget[g] = target
+        self.pacmanPosition[g] = self.nodePositions[start]
+        self.pacmanPosition[g, 0] -= (self.nodePositions[start, 0] - self.nodePositions[target, 0]) / 2
+        self.dying[g] = False
+
+    def resetGhosts(self, g):
+        self.ghostNode[g] = self.ghostStarts[1:]
+        self.ghostTarget[g] = self.ghostStarts[1:]
+        self.ghostPosition[g] = self.nodePositions[self.ghostStarts[1:]]
+        self.ghostBanned[g, 1:] = self.ghostBans[1:]
+        self.ghostReleased[g, 1:] = self.ghostRelease[1:] == 0
+        self.ghostDirection[g] = STOP
+        self.ghostPoints[g] = 200
+        self.modeStart[g, 1:] = self.playClock[g, None]
+        self.hasSaved[g, 1:] = False
+        self.guidesLeft[g, 1:] = 0
+        self.mode[g] = self.scheduleModes[0]
+        self.modeTime[g, 1:] = self.scheduleTimes[0]
+        self.modeSpeed[g, 1:] = 1
+        self.scheduleIndex[g, 1:] = 1
+
+    # Masks below are tested with count_nonzero, which costs far less than
+    # any() on arrays this small, and picked apart with nonzero().
+
+    def step(self, actions=None):
+        keys = self.noKeys if actions is None else np.asarray(actions)
+        live = ~self.gameover
+        active = live & ~self.paused
+        if np.count_nonzero(active):
+            # Timed events come due at the start of the frame, the way
+            # GameController's scheduler fires its PLAY timeline.
+            elapsed = self.dt * active
+            self.playClock += elapsed
+            self.updateModes(active)
+            if np.count_nonzero(self.fruitActive):
+                self.fruitActive &= ~(active & (self.playClock >= self.fruitDue))
+            self.updateEntities(active, elapsed, keys)
+            settle = active & (self.pauseType != NOPAUSE)
+            if np.count_nonzero(settle):
+                self.settlePause(settle.nonzero()[0])
+            self.checkPelletEvents(active)
+            self.checkGhostEvents(active)
+            if np.count_nonzero(self.fruitActive):
+                self.checkFruitEvents(active)
+        self.updatePause(live)
+        self.frames += live
+        if np.count_nonzero(self.playerPaused):
+            waiting = self.playerPaused & live
+            self.playerPaused &= ~waiting
+            self.paused &= ~waiting
+        return self.score, self.gameover
+
+    def run(self, policy, maxFrames=None):
+        while not self.gameover.all():
+            if maxFrames is not None and self.frames.max() >= maxFrames:
+                break
+            self.step(policy(self))
+        return self.frames
+
+    def updateEntities(self, active, elapsed, keys):
+        node, target, position = self.node, self.target, self.position
+        edge = node * self.numNodes + target
+        speed = np.where(self.edgePortals.take(edge), self.portalSpeeds, self.normalSpeeds)
+        speed *= self.modeSpeed
+        speed *= elapsed[:, None]
+        position += VECTORTABLE.take(self.direction, axis=0) * speed[:, :, None]
+
+        pacmanDirection = self.pacmanDirection
+        stopped = pacmanDirection == STOP
+        pressed = (keys != STOP) & active
+        start = pressed & stopped
+        if np.count_nonzero(start):
+            self.startPacman(start.nonzero()[0], keys)
+        moving = active & ~stopped
+        reverse = pressed & moving & (keys == OPPOSITETABLE.take(pacmanDirection))
+        if np.count_nonzero(reverse):
+            g = reverse.nonzero()[0]
+            self.reverse(g * ENTITIES)
+            edge[g, PACMAN] = self.pacmanNode[g] * self.numNodes + self.pacmanTarget[g]
+
+        # Every entity past its target this frame has reached that node.
+        vec = position - self.nodePositions.take(node, axis=0)
+        vec *= vec
+        reached = vec[:, :, 0] + vec[:, :, 1] >= self.edgeLengths.take(edge)
+        reached &= active[:, None]
+        arrived = reached[:, PACMAN] & moving
+        if np.count_nonzero(arrived):
+            self.pacmanReachedNode(arrived.nonzero()[0], keys)
+
+        # Every frightened ghost draws a new goal each frame, in ghost order,
+        # whether or not it is at a node and needs it.
+        freight = (self.modes == FREIGHT) & active[:, None]
+        drawn = np.count_nonzero(freight)
+        reached[:, PACMAN] = False
+        f = reached.reshape(-1).nonzero()[0]
+        if len(f) > 0:
+            self.ghostsReachedNode(f, freight if drawn else None)
+        if drawn:
+            self.goalCursor += freight.sum(axis=1, dtype=np.int32)
+            full = (self.goalCursor > GOALBUFFER - len(GHOSTS)).nonzero()[0]
+            if len(full) > 0:
+                self.fillGoals(full)
+
+    def startPacman(self, g, keys):
+        keys = keys[g]
+        neighbor = self.neighbors[self.pacmanNode[g], keys]
+        found = neighbor >= 0
+        g = g[found]
+        self.pacmanTarget[g] = neighbor[found]
+        self.pacmanDirection[g] = keys[found]
+
+    def reverse(self, f):
+        self.directionFlat[f] = OPPOSITETABLE[self.directionFlat[f]]
+        node = self.nodeFlat[f]
+        self.nodeFlat[f] = self.targetFlat[f]
+        self.targetFlat[f] = node
+
+    def pacmanReachedNode(self, g, keys):
+        target = self.pacmanTarget[g]
+        node = self.arrivals.take(target)
+        self.pacmanNode[g] = node
+        turn = target * 5
+        turn += self.pacmanDirection[g]
+        turn *= 5
+        turn += keys[g]
+        self.pacmanTarget[g] = self.pacmanTargets.take(turn)
+        self.pacmanDirection[g] = self.pacmanDirections.take(turn)
+        snap = self.pacmanSnaps.take(turn)
+        self.pacmanPosition[g[snap]] = self.nodePositions.take(node[snap], axis=0)
+
+    def ghostsReachedNode(self, f, freight):
+        g, e = self.entityGames.take(f), self.entityColumns.take(f)
+        before = self.positionFlat[f]
+        node = self.arrivals.take(self.targetFlat[f])
+        self.nodeFlat[f] = node
+        self.positionFlat[f] = self.nodePositions[node]
+        mode = self.modesFlat[f]
+        goal = self.getGoals(f, g, e, mode, before, freight)
+        spawn = mode == SPAWN
+        direction = self.getClosestDirection(f, node, spawn, goal)
+        self.directionFlat[f] = direction
+        self.targetFlat[f] = self.neighbors[node, direction]
+
+        home = spawn & (node == self.ghostSpawns.take(e))
+        guide = mode == GUIDE
+        done = home | guide
+        if np.count_nonzero(done):
+            self.popMode(f[done])
+            f = f[home | (guide & (self.modesFlat[f] == GUIDE))]
+            direction = self.modeDirectionFlat[f]
+            self.directionFlat[f] = direction
+            self.targetFlat[f] = self.neighbors[self.nodeFlat[f], direction]
+
+    def getGoals(self, f, g, e, mode, before, freight):
+        # A ghost only needs its goal on the frame it reaches a node.
+        goal = self.staticGoals.take(mode * ENTITIES + e, axis=0)
+        chase = mode == CHASE
+        if np.count_nonzero(chase):
+            goal[chase] = self.chaseGoal(g[chase], e[chase], before[chase])
+        scared = mode == FREIGHT
+        if np.count_nonzero(scared):
+            # The frame's draws for a game are taken from its cursor onwards,
+            # one per frightened ghost in ghost order.
+            g, f = g[scared], f[scared]
+            rank = (np.cumsum(freight, axis=1) - 1).reshape(-1)[f]
+            goal[scared] = self.goals[g * GOALBUFFER + self.goalCursor[g] + rank]
+        return goal
+
+    def chaseGoal(self, g, e, before):
+        # Inky aims off Blinky, who GameController moves first, so he reads
+        # Blinky where he has settled for the frame.  Clyde measures from
+        # where he was before being placed on the node.
+        pacman = self.pacmanPosition[g]
+        facing = VECTORTABLE.take(self.pacmanDirection[g], axis=0)
+        goal = pacman + facing * self.chaseAhead.take(e)[:, None]
+        inky = e == INKY+1
+        if np.count_nonzero(inky):
+            blinky = self.positionFlat[g[inky] * ENTITIES + BLINKY+1]
+            vec1 = pacman[inky] + facing[inky] * TILEWIDTH * 2
+            vec2 = (vec1 - blinky) * 2
+            goal[inky] = blinky + vec2
+        clyde = (e == CLYDE+1).nonzero()[0]
+        if len(clyde) > 0:
+            d = pacman[clyde] - before[clyde]
+            near = clyde[d[:, 0]**2 + d[:, 1]**2 <= (TILEWIDTH * 8)**2]
+            goal[near] = self.ghostScatter[CLYDE+1]
+        return goal
+
+    def getClosestDirection(self, f, node, spawn, goal):
+        key = node * 5 + self.directionFlat[f]
+        key *= 2
+        key += spawn
+        key *= ENTITIES
+        key += self.bannedFlat[f]
+        diff = self.nodeSteps.take(node, axis=0) - goal[:, None, :]
+        diff *= diff
+        distances = diff[:, :, 0] + diff[:, :, 1]
+        distances += self.directionCosts.take(key, axis=0)
+        return distances.argmin(axis=1)
+
+    def updateModes(self, active):
+        due = self.playClock[:, None] >= self.modeStart + self.modeTime
+        due &= active[:, None]
+        if np.count_nonzero(due):
+            f = due.reshape(-1).nonzero()[0]
+            mode = self.modesFlat[f]
+            self.reverse(f[(mode != GUIDE) & (mode != SPAWN)])
+            self.popMode(f)
+            self.modeStartFlat[f] = self.playClock[f // ENTITIES]
+
+    def popMode(self, f):
+        left = self.guidesLeftFlat[f]
+        guide = left > 0
+        fg = f[guide]
+        self.modesFlat[fg] = GUIDE
+        self.modeTimeFlat[fg] = np.inf
+        self.modeSpeedFlat[fg] = 0.5
+        self.modeDirectionFlat[fg] = self.ghostGuides[fg % ENTITIES, left[guide]-1]
+        self.guidesLeftFlat[fg] -= 1
+
+        f = f[~guide]
+        saved = self.hasSavedFlat[f]
+        fs = f[saved]
+        self.modesFlat[fs] = self.savedModeFlat[fs]
+        self.modeTimeFlat[fs] = self.savedTimeFlat[fs]
+        self.modeSpeedFlat[fs] = 1
+        self.hasSavedFlat[fs] = False
+
+        f = f[~saved]
+        index = self.scheduleIndexFlat[f]
+        self.modesFlat[f] = self.scheduleModes[index]
+        self.modeTimeFlat[f] = self.scheduleTimes[index]
+        self.modeSpeedFlat[f] = 1
+        self.scheduleIndexFlat[f] = np.minimum(index+1, len(MODESCHEDULE)-1)
+
+    def spawnFruit(self, g):
+        start = self.startNodes[FRUITSTART]
+        target = self.neighbors[start, LEFT]
+        self.fruitActive[g] = True
+        self.fruitDue[g] = self.playClock[g] + FRUITLIFESPAN
+        self.fruitPosition[g] = self.nodePositions[start]
+        self.fruitPosition[g, 0] -= (self.nodePositions[start, 0] - self.nodePositions[target, 0]) / 2
+
+    def startTimer(self, g, pauseTime, pauseType=NOPAUSE):
+        self.pauseDue[g] = self.pauseClock[g] + pauseTime
+        self.pauseType[g] = pauseType
+        self.paused[g] = True
+
+    def updatePause(self, live):
+        counting = self.paused & ~self.playerPaused & live
+        if np.count_nonzero(counting):
+            self.pauseClock += self.dt * counting
+            self.paused &= ~(counting & (self.pauseClock >= self.pauseDue))
+
+    def settlePause(self, g):
+        die = g[self.pauseType[g] == DIEPAUSE]
+        over = die[self.lives[die] == 0]
+        self.gameover[over] = True
+        self.restartLevel(die[self.lives[die] != 0])
+        clear = g[self.pauseType[g] == CLEARPAUSE]
+        self.level[clear] += 1
+        self.startLevel(clear)
+        self.pauseType[g] = NOPAUSE
+
+    def freightMode(self, g):
+        mode = self.modes[g]
+        rows, e = np.nonzero(self.isGhost & (mode != SPAWN) & (mode != GUIDE))
+        g = g[rows]
+        f = g * ENTITIES + e
+        fs = f[self.modesFlat[f] != FREIGHT]
+        gs = fs // ENTITIES
+        self.savedModeFlat[fs] = self.modesFlat[fs]
+        self.savedTimeFlat[fs] = self.modeTimeFlat[fs] - (self.playClock[gs] - self.modeStartFlat[fs])
+        self.hasSavedFlat[fs] = True
+        self.modesFlat[f] = FREIGHT
+        self.modeTimeFlat[f] = 7
+        self.modeSpeedFlat[f] = 0.5
+        self.modeStartFlat[f] = self.playClock[g]
+        self.reverse(f)
+
+    def spawnMode(self, f, speed=1):
+        self.modesFlat[f] = SPAWN
+        self.modeTimeFlat[f] = np.inf
+        self.modeSpeedFlat[f] = speed
+        self.modeStartFlat[f] = self.playClock[f // ENTITIES]
+        self.guidesLeftFlat[f] = self.ghostGuideLengths[f % ENTITIES]
+
+    def checkPelletEvents(self, active):
+        position = self.pacmanPosition
+        tiles = np.floor(position * (1.0 / TILEWIDTH)).astype(np.int32)
+        tile = tiles[:, 1] * self.gridWidth + tiles[:, 0]
+        candidates = self.pelletGrid.take(tile[:, None] + self.pelletOffsets)
+        d = self.pelletPositions.take(candidates, axis=0) - position[:, None, :]
+        d *= d
+        hit = d[:, :, 0] + d[:, :, 1] <= self.pelletReach.take(candidates)
+        hit &= self.pellets.reshape(-1).take(self.pelletRows + candidates)
+        hit &= active[:, None]
+        if not np.count_nonzero(hit):
+            return
+        # Every pellet touched is eaten, in the same scan order as
+        # CollisionGrid, so fruit and clear counts land on the same pellet.
+        # A game's first pellets are eaten together, then its second ones.
+        rows, cols = hit.nonzero()
+        pellets = candidates[rows, cols]
+        while len(rows) > 0:
+            first = np.ones(len(rows), dtype=bool)
+            first[1:] = rows[1:] != rows[:-1]
+            self.eatPellets(rows[first], pellets[first])
+            rows, pellets = rows[~first], pellets[~first]
+
+    def eatPellets(self, g, pellet):
+        eaten = self.pelletsEaten[g] + 1
+        self.pelletsEaten[g] = eaten
+        self.score[g] += self.pelletPoints.take(pellet)
+        fruit = self.fruitCounts.take(eaten)
+        if np.count_nonzero(fruit):
+            fruit = g[fruit]
+            self.spawnFruit(fruit[~self.fruitActive[fruit]])
+        self.pellets[g, pellet] = False
+        left = self.numPellets - eaten
+        self.pelletsLeft[g] = left
+        power = self.powerPellets.take(pellet)
+        if np.count_nonzero(power):
+            power = g[power]
+            self.ghostPoints[power] = 200
+            self.freightMode(power)
+        clear = left == 0
+        if np.count_nonzero(clear):
+            self.startTimer(g[clear], 3, CLEARPAUSE)
+
+    def checkGhostEvents(self, active):
+        release = ~self.ghostReleased & (self.pelletsEaten[:, None] >= self.ghostRelease)
+        release &= active[:, None]
+        if np.count_nonzero(release):
+            f = release.reshape(-1).nonzero()[0]
+            self.bannedFlat[f] = 0
+            self.spawnMode(f)
+            self.releasedFlat[f] = True
+
+        d = self.ghostPosition - self.pacmanPosition[:, None, :]
+        d *= d
+        hit = d[:, :, 0] + d[:, :, 1] <= (COLLIDERADIUS * 2)**2
+        hit &= active[:, None]
+        if not np.count_nonzero(hit):
+            return
+        # Ghosts are handled in group order.  Each frightened ghost touched
+        # is worth twice the one before, and the first ghost that is not
+        # frightened kills Pac-Man and drops the rest.  Nothing is handled
+        # once the level is cleared.
+        g = hit.any(axis=1).nonzero()[0]
+        hit = hit[g]
+        playing = (~self.dying[g] & (self.pelletsLeft[g] > 0))[:, None]
+        mode = self.mode[g]
+        deadly = hit & playing & ((mode == CHASE) | (mode == SCATTER))
+        eaten = hit & playing & (mode == FREIGHT) & (np.cumsum(deadly, axis=1) == 0)
+        order = np.cumsum(eaten, axis=1) - eaten
+        self.score[g] += (self.ghostPoints[g, None] * 2**order * eaten).sum(axis=1)
+        self.ghostPoints[g] *= 2**eaten.sum(axis=1)
+        rows, j = np.nonzero(eaten)
+        self.spawnMode(g[rows] * ENTITIES + j + 1, speed=2)
+        self.startTimer(g[eaten.any(axis=1)], 1)
+        die = g[deadly.any(axis=1)]
+        self.lives[die] -= 1
+        self.dying[die] = True
+        self.startTimer(die, 3, DIEPAUSE)
+
+    def checkFruitEvents(self, active):
+        g = (self.fruitActive & active).nonzero()[0]
+        d = self.pacmanPosition[g] - self.fruitPosition[g]
+        eaten = (d[:, 0]**2 + d[:, 1]**2 <= (COLLIDERADIUS * 2)**2) & ~self.dying[g] & (self.pelletsLeft[g] > 0)
+        self.score[g[eaten]] += FRUITPOINTS
+        self.fruitActive[g[eaten]] = False
@@ -0,0 +1,264 @@
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import subprocess
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+import pygame
+import numpy as np
+from nodes import NodeGroup
+from pellets import PelletGroup, PelletLayout
+from levels import LevelController
+from mazecache import MazeCache
+from runner import RandomPolicy
+from replay import loadRecording, replay
+from constants import SCREENSIZE, UP, DOWN, LEFT, RIGHT, STOP
+
+# Every scenario replays the same scripted game so numbers from two revisions
+# measure the same work.  Results are seconds per unit, lower is better.
+SEED = 1234
+REGRESSION = 0.10
+
+# BatchEngine should cost at most a tenth as much per game as GameController.
+BATCHSIZES = (64, 512, 2048)
+BATCHTARGET = 10
+
+def bestTime(func, repeat=3):
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, result
+
+def readGrid(textfile):
+    f = open(textfile, "r")
+    lines = [line.rstrip('\n').rstrip('\r') for line in f]
+    return [line.split(' ') for line in lines]
+
+def tileShape(scale):
+    # Lay the copies out as close to a square as the scale allows.
+    across = int(scale**0.5)
+    while scale % across != 0:
+        across -= 1
+    return scale // across, across
+
+def tileMaze(grid, scale):
+    across, down = tileShape(scale)
+    tiled = []
+    for copyRow in range(down):
+        for line in grid:
+            row = []
+            for copyCol in range(across):
+                if copyRow == 0 and copyCol == 0:
+                    row += line
+                else:
+                    # Every portal symbol must appear exactly twice.
+                    row += ["+" if symbol == "1" else symbol for symbol in line]
+            tiled.append(row)
+    return tiled
+
+def benchNodeGroups(mazefile="maze1.txt", scales=(1, 10, 100)):
+    grid = readGrid(mazefile)
+    results = {}
+    directory = tempfile.mkdtemp()
+    for scale in scales:
+        path = os.path.join(directory, "maze_x%d.txt" % scale)
+        f = open(path, "w")
+        f.write("\n".join(" ".join(line) for line in tileMaze(grid, scale)))
+        f.close()
+        seconds, nodes = bestTime(lambda: NodeGroup(path), repeat=3 if scale < 100 else 1)
+        results["nodegroup_x%d" % scale] = {"seconds":seconds, "nodes":len(nodes.nodeList)}
+        os.remove(path)
+    os.rmdir(directory)
+    return results
+
+def getGame(dirtyRects=False):
+    from run import GameController
+    return GameController(headless=True, dirtyRects=dirtyRects)
+
+def startScripted(game, seed=SEED):
+    game.policy = RandomPolicy(seed)
+    game.startGame(seed)
+
+def benchSimulation(frames=6000, seed=SEED):
+    # Only the game logic: updates, collisions and pauses, no drawing.
+    game = getGame()
+    startScripted(game, seed)
+    start = time.perf_counter()
+    for i in range(frames):
+        if game.gameover:
+            startScripted(game, seed)
+        game.update()
+    seconds = time.perf_counter() - start
+    return {"seconds":seconds / frames, "fps":frames / seconds, "frames":frames}
+
+def benchBatch(numGames, frames=900, seed=SEED, interval=15):
+    # Seconds per game per frame, with every game driven the way
+    # RandomPolicy drives the single game and started over once it ends.
+    from batch import BatchEngine
+    batch = BatchEngine(numGames, seed=seed)
+    rng = np.random.default_rng(seed)
+    choices = np.array([UP, DOWN, LEFT, RIGHT, STOP])
+    start = time.perf_counter()
+    for i in range(frames):
+        if i % interval == 0:
+            keys = choices[rng.integers(0, len(choices), numGames)]
+        score, gameover = batch.step(keys)
+        if gameover.any():
+            batch.reset(gameover)
+    seconds = time.perf_counter() - start
+    return {"seconds":seconds / (frames * numGames), "fps":frames * numGames / seconds,
+            "frames":frames, "games":numGames}
+
+def reportBatch(results, target=BATCHTARGET):
+    # Per game speedup of each batch size over the single game, against the
+    # target.  Returns the sizes that fall short.
+    missed = []
+    for name in sorted(results.keys()):
+        if not name.startswith("batch_"):
+            continue
+        speedup = results[name]["speedup"]
+        if speedup < target:
+            missed.append(results[name]["games"])
+        print("%-28s %11.1fx per game (target %dx: %s)" % (name, speedup, target,
+              "met" if speedup >= target else "MISSED"))
+    return missed
+
+def benchRender(frames=600, seed=SEED, dirtyRects=False):
+    # Renders the states the scripted game walks through.  Simulation time
+    # is left out of the measurement.
+    game = getGame(dirtyRects)
+    startScripted(game, seed)
+    seconds = 0
+    for i in range(frames):
+        if game.gameover:
+            startScripted(game, seed)
+        game.update()
+        start = time.perf_counter()
+        game.render()
+        seconds += time.perf_counter() - start
+    return {"seconds":seconds / frames, "fps":frames / seconds, "frames":frames}
+
+def benchReplay(path):
+    # A recorded session as the workload, fast-forwarded without drawing.
+    recording = loadRecording(path)
+    game = getGame()
+    start = time.perf_counter()
+    replay(recording, game)
+    seconds = time.perf_counter() - start
+    return {"seconds":seconds / game.frames, "fps":game.frames / seconds, "frames":game.frames}
+
+def benchLevelConstruction(repeat=20):
+    levelmap = LevelController().getLevel()
+    compiled = MazeCache().load(levelmap)
+    mazename = levelmap["mazename"].split(".")[0]
+    background = pygame.Surface(SCREENSIZE)
+    game = getGame()
+    startScripted(game)
+    maze = game.maze
+    def construct():
+        maze.getMaze(mazename)
+        maze.constructMaze(background)
+    results = {}
+    for name, func in [("nodegroup_parse", lambda: NodeGroup(levelmap["mazename"])),
+                       ("nodegroup_table", lambda: NodeGroup(levelmap["mazename"], compiled.nodeTable)),
+                       ("pelletgroup_parse", lambda: PelletGroup(levelmap["pelletname"], PelletLayout(levelmap["pelletname"]))),
+                       ("pelletgroup_cached", lambda: PelletGroup(levelmap["pelletname"], compiled.pelletLayout)),
+                       ("maze_construct", construct),
+                       ("start_level", game.startLevel)]:
+        seconds, result = bestTime(func, repeat)
+        results[name] = {"seconds":seconds}
+    return results
+
+def benchStartup(repeat=3):
+    # A fresh interpreter each time, from launch until the first frame has
+    # been simulated and drawn.
+    script = ("import time; start = time.perf_counter()\n"
+              "from run import GameController\n"
+              "game = GameController(headless=True)\n"
+              "game.startGame(); game.update(); game.render()\n"
+              "print(time.perf_counter() - start)\n")
+    env = dict(os.environ, SDL_VIDEODRIVER="dummy", PYGAME_HIDE_SUPPORT_PROMPT="1")
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        output = subprocess.run([sys.executable, "-c", script], env=env, check=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)),
+                                capture_output=True, text=True).stdout
+        total = time.perf_counter() - start
+        inside = float(output.strip().splitlines()[-1])
+        if best is None or total < best[0]:
+            best = (total, inside)
+    return {"seconds":best[0], "inProcess":best[1]}
+
+def runSuite(quick=False, replays=()):
+    scale = 0.1 if quick else 1.0
+    results = {}
+    for path in replays:
+        results["replay_"+os.path.basename(path).split(".")[0]] = benchReplay(path)
+    results["simulation"] = benchSimulation(int(6000*scale))
+    for numGames in BATCHSIZES:
+        result = benchBatch(numGames, int(900*scale))
+        result["speedup"] = results["simulation"]["seconds"] / result["seconds"]
+        results["batch_x%d" % numGames] = result
+    results["render_full"] = benchRender(int(600*scale))
+    results["render_dirty"] = benchRender(int(600*scale), dirtyRects=True)
+    for name, result in benchLevelConstruction(5 if quick else 20).items():
+        results["level_"+name] = result
+    results["startup"] = benchStartup(1 if quick else 3)
+    for name, result in benchNodeGroups(scales=(1, 10) if quick else (1, 10, 100)).items():
+        results[name] = result
+    return {"python":platform.python_version(), "pygame":pygame.version.ver,
+            "platform":platform.platform(), "seed":SEED, "quick":quick, "results":results}
+
+def compare(old, new, threshold=REGRESSION):
+    # Returns the names that got slower by more than threshold.
+    regressions = []
+    for name in sorted(new["results"].keys()):
+        if name not in old["results"]:
+            continue
+        before = old["results"][name]["seconds"]
+        after = new["results"][name]["seconds"]
+        change = (after - before) / before if before > 0 else 0.0
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        print("%-28s %12.4f ms %12.4f ms %+7.1f%%%s" % (name, before*1000, after*1000, change*100, flag))
+    return regressions
+
+def loadResults(path):
+    f = open(path, "r")
+    results = json.load(f)
+    f.close()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Headless Pacman benchmarks")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"),
+                        help="compare two result files instead of running")
+    parser.add_argument("--threshold", type=float, default=REGRESSION,
+                        help="slowdown that counts as a regression (default 0.10)")
+    parser.add_argument("--quick", action="store_true", help="shorter runs for a smoke test")
+    parser.add_argument("--replay", action="append", default=[], metavar="RECORDING",
+                        help="also time fast-forwarding a recorded session")
+    args = parser.parse_args()
+    if args.compare:
+        regressions = compare(loadResults(args.compare[0]), loadResults(args.compare[1]), args.threshold)
+        sys.exit(1 if regressions else 0)
+    suite = runSuite(args.quick, args.replay)
+    for name in suite["results"].keys():
+        print("%-28s %12.4f ms" % (name, suite["results"][name]["seconds"]*1000))
+    reportBatch(suite["results"])
+    if args.output:
+        f = open(args.output, "w")
+        json.dump(suite, f, indent=2, sort_keys=True)
+        f.close()
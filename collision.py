@@ -0,0 +1,72 @@
+from constants import *
+
+# Kinds of contact, in the order GameController handles them.
+PELLET = 0
+GHOST = 1
+FRUIT = 2
+
+
+class CollisionGrid(object):
+    """Finds everything Pac-Man touches in a frame with one pass.
+
+    Ghosts and fruit are bucketed by the tile they are in, and pellets
+    already live in PelletGroup's tile grid.  Nothing that can touch Pac-Man
+    is more than a tile away, so only his tile and the eight around it are
+    ever tested, however many ghosts there are.
+    """
+    def __init__(self):
+        self.buckets = {}
+        self.used = []
+
+    def clear(self):
+        # Buckets are emptied rather than dropped so a frame allocates nothing.
+        for bucket in self.used:
+            del bucket[:]
+        del self.used[:]
+
+    def add(self, kind, order, entity):
+        key = (int(entity.position.x // TILEWIDTH), int(entity.position.y // TILEHEIGHT))
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = []
+            self.buckets[key] = bucket
+        if len(bucket) == 0:
+            self.used.append(bucket)
+        bucket.append((kind, order, entity))
+
+    def getContacts(self, pacman, pellets, ghosts, fruit=None):
+        # Returns (kind, target) pairs: pellets as indices, then ghosts in
+        # group order, then the fruit.
+        position = pacman.position
+        contacts = []
+        for index in pellets.getNearbyPellets(position):
+            x, y = pellets.layout.getPosition(index)
+            dx = position.x - x
+            dy = position.y - y
+            rSquared = (pellets.getPellet(index).radius + pacman.collideRadius)**2
+            if dx**2 + dy**2 <= rSquared:
+                contacts.append((PELLET, index))
+
+        self.clear()
+        order = 0
+        for ghost in ghosts:
+            self.add(GHOST, order, ghost)
+            order += 1
+        if fruit is not None:
+            self.add(FRUIT, order, fruit)
+
+        found = []
+        col = int(position.x // TILEWIDTH)
+        row = int(position.y // TILEHEIGHT)
+        for c in (col-1, col, col+1):
+            for r in (row-1, row, row+1):
+                bucket = self.buckets.get((c, r))
+                if bucket:
+                    for kind, order, entity in bucket:
+                        rSquared = (pacman.collideRadius + entity.collideRadius)**2
+                        if position.distanceSquared(entity.position) <= rSquared:
+                            found.append((order, kind, entity))
+        found.sort()
+        for order, kind, entity in found:
+            contacts.append((kind, entity))
+        return contacts
@@ -8,17 +8,28 @@ SCREENWIDTH = NCOLS*TILEWIDTH
 SCREENHEIGHT = NROWS*TILEHEIGHT
 SCREENSIZE = (SCREENWIDTH, SCREENHEIGHT)
 
-UP = Vector2(0, -1)
-DOWN = Vector2(0, 1)
-LEFT = Vector2(-1, 0)
-RIGHT = Vector2(1, 0)
-STOP = Vector2()
+# Directions are small ints so they can index lists and compare cheaply.
+# VECTORS holds the unit vector of each and OPPOSITE its reverse.
+UP = 0
+DOWN = 1
+LEFT = 2
+RIGHT = 3
+STOP = 4
+DIRECTIONS = [UP, DOWN, LEFT, RIGHT]
+VECTORS = [Vector2(0, -1), Vector2(0, 1), Vector2(-1, 0), Vector2(1, 0), Vector2()]
+OPPOSITE = [DOWN, UP, RIGHT, LEFT, STOP]
 
 YELLOW = (255, 255, 0)
 BLACK = (0, 0, 0)
 WHITE = (255, 255, 255)
 RED = (255, 0, 0)
+GREEN = (0, 255, 0)
 PINK = (255,100,150)
 TEAL = (100,255,255)
 ORANGE = (230,190,40)
 TRANSPARENT = (255, 0, 255)
+
+# The sheet has no white maze row, so the level clear flash alternates with
+# the lighter blue walls instead.
+FLASHROW = 2
+FLASHTIME = 0.2
@@ -0,0 +1,41 @@
+from collections import OrderedDict
+
+class DecisionCache(object):
+    """Bounded least recently used cache of ghost direction choices.
+
+    Keys describe everything a choice depends on, so one cache can be shared
+    by every ghost and every game in a process.
+    """
+    def __init__(self, maxSize=4096):
+        self.maxSize = maxSize
+        self.decisions = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        direction = self.decisions.get(key)
+        if direction is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.decisions.move_to_end(key)
+        return direction
+
+    def put(self, key, direction):
+        self.decisions[key] = direction
+        if len(self.decisions) > self.maxSize:
+            self.decisions.popitem(last=False)
+
+    def clear(self):
+        self.decisions.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def hitRate(self):
+        lookups = self.hits + self.misses
+        if lookups == 0:
+            return 0.0
+        return self.hits / float(lookups)
+
+    def stats(self):
+        return {"hits":self.hits, "misses":self.misses, "size":len(self.decisions), "hitRate":self.hitRate()}
@@ -13,20 +13,21 @@ class Entity(object):
         self.nodes = nodes
         self.node = nodes.nodeList[0]
         self.target = self.node
+        self.position = Vector2()
         self.setPosition()
         self.visible = True
         self.image = None
         self.spritesheet = spritesheet
         
     def setPosition(self):
-        self.position = self.node.position.copy()
+        self.position.set(self.node.position.x, self.node.position.y)
         
     def update(self, dt):
-        self.position += self.direction*self.speed*dt
+        self.position.addScaled(VECTORS[self.direction], self.speed*dt)
         self.moveBySelf()
         
     def moveBySelf(self):
-        if self.direction is not STOP:
+        if self.direction != STOP:
             if self.overshotTarget():
                 self.node = self.target
                 self.portal()
@@ -38,22 +39,27 @@ class Entity(object):
                     
     def overshotTarget(self):
         if self.target is not None:
-            vec1 = self.target.position - self.node.position
-            vec2 = self.position - self.node.position
-            node2Target = vec1.magnitudeSquared()
-            node2Self = vec2.magnitudeSquared()
+            node2Target = self.target.position.distanceSquared(self.node.position)
+            node2Self = self.position.distanceSquared(self.node.position)
             return node2Self >= node2Target
         return False
     
     def reverseDirection(self):
-        if self.direction is UP: self.direction = DOWN
-        elif self.direction is DOWN: self.direction = UP
-        elif self.direction is LEFT: self.direction = RIGHT
-        elif self.direction is RIGHT: self.direction = LEFT
+        self.direction = OPPOSITE[self.direction]
         temp = self.node
         self.node = self.target
         self.target = temp
         
+    def snapshot(self):
+        target = -1 if self.target is None else self.target.index
+        return (self.node.index, target, self.position.x, self.position.y, self.direction, self.visible)
+
+    def restore(self, state):
+        node, target, x, y, self.direction, self.visible = state
+        self.node = self.nodes.allNodes[node]
+        self.target = None if target == -1 else self.nodes.allNodes[target]
+        self.position.set(x, y)
+
     def portal(self):
         if self.node.portalNode:
             self.node = self.node.portalNode
@@ -65,7 +71,8 @@ class Entity(object):
                 p = self.position.asTuple()
                 x = int(p[0] + TILEWIDTH//2 - self.image.get_width()//2)
                 y = int(p[1] + TILEHEIGHT//2 - self.image.get_height()//2)
-                screen.blit(self.image, (x, y))
+                return screen.blit(self.image, (x, y))
             else:
                 p = self.position.asInt()
-                pygame.draw.circle(screen, self.color, p, self.radius)
+                return pygame.draw.circle(screen, self.color, p, self.radius)
+        return None
@@ -0,0 +1,61 @@
+import numpy as np
+import pygame
+from constants import *
+from run import GameController
+
+# Action indices understood by PacmanEnv.step.  None lets Pac-Man keep moving
+# the way he is going, exactly like releasing every arrow key.
+ACTIONS = [None, UP, DOWN, LEFT, RIGHT]
+
+
+class PacmanEnv(object):
+    """Gym-style reset/step wrapper around a headless GameController.
+
+    The game draws straight into a NumPy owned pixel buffer and observations
+    are a (height, width, 3) view of that buffer, so no frame is copied.  The
+    same array is returned every step and is overwritten by the next frame;
+    copy it if it has to be kept.
+    """
+    def __init__(self, frameskip=1, pixels=True):
+        self.frameskip = frameskip
+        self.pixels = pixels
+        self.action = None
+        self.game = GameController(headless=True, policy=self.getAction)
+        self.actions = ACTIONS
+        # A surface made with frombuffer draws into memory that NumPy owns
+        # without locking it, unlike surfarray.pixels3d on the screen.
+        self.buffer = np.zeros((SCREENHEIGHT, SCREENWIDTH, 4), dtype=np.uint8)
+        self.game.screen = pygame.image.frombuffer(self.buffer, SCREENSIZE, "RGBX")
+        self.observation = self.buffer[:, :, :3]
+
+    def getAction(self, game):
+        return self.action
+
+    def reset(self, seed=None):
+        self.action = None
+        self.game.startGame(seed)
+        return self.observe()
+
+    def step(self, action):
+        self.action = ACTIONS[action]
+        game = self.game
+        score = game.score
+        for i in range(self.frameskip):
+            game.update()
+            if game.gameover:
+                break
+        reward = game.score - score
+        return self.observe(), reward, game.gameover, self.getInfo()
+
+    def observe(self):
+        if not self.pixels:
+            return None
+        self.game.render()
+        return self.observation
+
+    def getInfo(self):
+        game = self.game
+        return {"score":game.score,
+                "lives":game.pacman.lives,
+                "level":game.level.level,
+                "frames":game.frames}
@@ -1,5 +1,6 @@
 import pygame
 from entity import Entity
+from nodes import FRUITSTART
 from constants import *
 
 class Fruit(Entity):
@@ -7,18 +8,22 @@ class Fruit(Entity):
         Entity.__init__(self, nodes, spritesheet)
         self.name = "fruit"
         self.color = (0,200,0)
-        self.setStartPosition()
         self.lifespan = 5
-        self.timer = 0
-        self.destroy = False
         self.points = 100
         self.image = self.spritesheet.getImage(8, 2, TILEWIDTH, TILEHEIGHT)
-        
-    def update(self, dt):
-        self.timer += dt
-        if self.timer >= self.lifespan:
-            self.destroy = True
+        self.reset()
+
+    def reset(self, nodes=None):
+        if nodes is not None:
+            self.nodes = nodes
+        self.setStartPosition()
             
+    def snapshot(self):
+        return Entity.snapshot(self)
+
+    def restore(self, state):
+        Entity.restore(self, state)
+
     def setStartPosition(self):
         self.node = self.findStartNode()
         self.target = self.node.neighbors[LEFT]
@@ -26,7 +31,4 @@ class Fruit(Entity):
         self.position.x -= (self.node.position.x - self.target.position.x) / 2
         
     def findStartNode(self):
-        for node in self.nodes.nodeList:
-            if node.fruitStartNode:
-                return node
-        return None
+        return self.nodes.getSpecialNode(FRUITSTART)
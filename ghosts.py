@@ -1,35 +1,64 @@
 import pygame
 from entity import Entity
+from nodes import SPAWNNODE, BLINKYSTART, PINKYSTART, INKYSTART, CLYDESTART
 from constants import *
 from vector import Vector2
-from random import randint
-from modes import Mode
+import random
+from modes import Mode, MODESCHEDULE
 from stack import Stack
 from animation import Animation
+from scheduler import Scheduler, PLAY
+
+# The mode schedule in stack order.  Nothing ever changes a Mode once it is
+# made, so every ghost's stack starts from these same objects.
+SCHEDULEMODES = [Mode(name=name, time=time) for name, time in reversed(MODESCHEDULE)]
 
 class Ghost(Entity):
-    def __init__(self, nodes, spritesheet):
+    def __init__(self, nodes, spritesheet, scheduler=None):
         Entity.__init__(self, nodes, spritesheet)
         self.name = "ghost"
+        if scheduler is None:
+            scheduler = Scheduler()
+        self.scheduler = scheduler
         self.goal = Vector2()
-        self.points = 200
-        self.modeStack = self.setupModeStack()
-        self.mode = self.modeStack.pop()
-        self.modeTimer = 0
-        self.spawnNode = self.findSpawnNode()
+        self.modeStack = Stack()
+        self.modeStart = 0
         self.setGuideStack()
         self.pelletsForRelease = 0
-        self.released = True
         self.bannedDirections = []
+        self.pathfinding = False
+        self.decisions = None
+        self.random = random
         self.animation = None
         self.animations = {}
+
+    def reset(self, nodes=None):
+        # Puts the ghost back the way it starts a level.  Everything it owns
+        # is reused, so a death or a new level allocates nothing.
+        if nodes is not None:
+            self.nodes = nodes
+        self.direction = STOP
+        self.speed = 100
+        self.visible = True
+        self.goal.set(0, 0)
+        self.points = 200
+        self.modeStack.items[:] = SCHEDULEMODES
+        self.mode = self.modeStack.pop()
+        self.startModeTimer()
+        self.scheduleMode()
+        self.released = True
+        del self.bannedDirections[:]
+        for animation in self.animations.values():
+            animation.reset()
+            animation.dt = 0
+        self.setStartPosition()
+        self.spawnNode = self.findSpawnNode()
         
     def update(self, dt, pacman, blinky=None):
         self.visible = True
         self.portalSlowdown()
         speedMod = self.speed * self.mode.speedMult
-        self.position += self.direction*speedMod*dt
-        self.modeUpdate(dt)
+        self.position.addScaled(VECTORS[self.direction], speedMod*dt)
         if self.mode.name == "CHASE":
             self.chaseGoal(pacman, blinky)
         elif self.mode.name == "SCATTER":
@@ -43,9 +72,10 @@ class Ghost(Entity):
         
     def getValidDirections(self):
         validDirections = []
-        for key in self.node.neighbors.keys():
+        backwards = OPPOSITE[self.direction]
+        for key in DIRECTIONS:
             if self.node.neighbors[key] is not None:
-                if key != self.direction * -1:
+                if key != backwards:
                     if not self.mode.name == "SPAWN":
                         if not self.node.homeEntrance:
                             if key not in self.bannedDirections:
@@ -60,113 +90,141 @@ class Ghost(Entity):
         return validDirections
     
     def randomDirection(self, validDirections):
-        index = randint(0, len(validDirections) - 1)
+        index = self.random.randint(0, len(validDirections) - 1)
         return validDirections[index]
 
-    def getClosestDirection(self, validDirections):
-        distances = []
+    def getClosestDirection(self, validDirections, goal=None):
+        if self.pathfinding and self.mode.name == "SPAWN":
+            return self.nodes.getPathDirection(self.node, self.spawnNode, validDirections)
+        if goal is None:
+            goal = self.goal
+        position = self.node.position
+        best = None
         for direction in validDirections:
-            diffVec = self.node.position + direction*TILEWIDTH - self.goal
-            distances.append(diffVec.magnitudeSquared())
-        index = distances.index(min(distances))
-        return validDirections[index]
+            x = position.x + VECTORS[direction].x*TILEWIDTH - goal.x
+            y = position.y + VECTORS[direction].y*TILEWIDTH - goal.y
+            distance = x**2 + y**2
+            if best is None or distance < bestDistance:
+                best, bestDistance = direction, distance
+        return best
+
+    def chooseDirection(self):
+        if self.decisions is None:
+            return self.getClosestDirection(self.getValidDirections())
+        # The choice only depends on what is in the key, so with the goal
+        # snapped to its tile it can be reused by any ghost in any game.
+        col = int(self.goal.x // TILEWIDTH)
+        row = int(self.goal.y // TILEHEIGHT)
+        key = (self.nodes.level, self.node.position.asTuple(), self.direction, self.mode.name,
+               tuple(self.bannedDirections), self.pathfinding, col, row)
+        direction = self.decisions.get(key)
+        if direction is None:
+            goal = Vector2(col*TILEWIDTH, row*TILEHEIGHT)
+            direction = self.getClosestDirection(self.getValidDirections(), goal)
+            self.decisions.put(key, direction)
+        return direction
     
     def moveBySelf(self):
         if self.overshotTarget():
             self.node = self.target
             self.portal()
-            validDirections = self.getValidDirections()
-            self.direction = self.getClosestDirection(validDirections)
+            self.direction = self.chooseDirection()
             self.target = self.node.neighbors[self.direction]
             self.setPosition()
             if self.mode.name == "SPAWN":
                 if self.position == self.goal:
                     self.mode = self.modeStack.pop()
+                    self.scheduleMode()
                     self.direction = self.mode.direction
                     self.target = self.node.neighbors[self.direction]
                     self.setPosition()
             elif self.mode.name == "GUIDE":
                 self.mode = self.modeStack.pop()
+                self.scheduleMode()
                 if self.mode.name == "GUIDE":
                     self.direction = self.mode.direction
                     self.target = self.node.neighbors[self.direction]
                     self.setPosition()
             
     def forceBacktrack(self):
-        if self.direction * -1 == UP:
-            return UP
-        if self.direction * -1 == DOWN:
-            return DOWN
-        if self.direction * -1 == LEFT:
-            return LEFT
-        if self.direction * -1 == RIGHT:
-            return RIGHT
+        return OPPOSITE[self.direction]
         
     def portalSlowdown(self):
         self.speed = 100
         if self.node.portalNode or self.target.portalNode:
             self.speed = 50
 
-    def setupModeStack(self):
-        modes = Stack()
-        modes.push(Mode(name="CHASE"))
-        modes.push(Mode(name="SCATTER", time=5))
-        modes.push(Mode(name="CHASE", time=20))
-        modes.push(Mode(name="SCATTER", time=7))
-        modes.push(Mode(name="CHASE", time=20))
-        modes.push(Mode(name="SCATTER", time=7))
-        modes.push(Mode(name="CHASE", time=20))
-        modes.push(Mode(name="SCATTER", time=7))
-        return modes
-    
+    def snapshot(self):
+        return (Entity.snapshot(self), self.mode.snapshot(), self.modeStart,
+                tuple(mode.snapshot() for mode in self.modeStack.items),
+                self.released, tuple(self.bannedDirections), self.points, self.goal.x, self.goal.y)
+
+    def restore(self, state):
+        entity, mode, self.modeStart, stack, self.released, banned, self.points, x, y = state
+        Entity.restore(self, entity)
+        self.mode = Mode(*mode)
+        self.modeStack.items = [Mode(*item) for item in stack]
+        self.bannedDirections = list(banned)
+        self.goal.set(x, y)
+
+    # Every ghost owns its goal vector and the goal methods only overwrite
+    # it, so choosing a target does not allocate.
     def scatterGoal(self):
-        self.goal = Vector2(SCREENSIZE[0], 0)
+        self.goal.set(SCREENSIZE[0], 0)
         
     def chaseGoal(self, pacman, blinky=None):
-        self.goal = pacman.position
+        self.goal.set(pacman.position.x, pacman.position.y)
 
     def randomGoal(self):
-        x = randint(0, NCOLS*TILEWIDTH)
-        y = randint(0, NROWS*TILEHEIGHT)
-        self.goal = Vector2(x, y)
+        x = self.random.randint(0, NCOLS*TILEWIDTH)
+        y = self.random.randint(0, NROWS*TILEHEIGHT)
+        self.goal.set(x, y)
                     
-    def modeUpdate(self, dt):
-        self.modeTimer += dt
+    # A timed mode ends with a "ghostmode" event on the PLAY timeline, due
+    # mode.time after modeStart.  Modes taken off the stack without a restart
+    # keep counting from the last one, as they always have.
+    def startModeTimer(self):
+        self.modeStart = self.scheduler.now(PLAY)
+
+    def getModeTime(self):
+        return self.scheduler.now(PLAY) - self.modeStart
+
+    def scheduleMode(self):
+        self.scheduler.cancel(PLAY, "ghostmode", self.name)
         if self.mode.time is not None:
-            if self.modeTimer >= self.mode.time:
-                self.reverseDirection()
-                self.mode = self.modeStack.pop()
-                self.modeTimer = 0
+            self.scheduler.scheduleAt(PLAY, self.modeStart + self.mode.time, "ghostmode", self.name)
+
+    def nextMode(self):
+        self.reverseDirection()
+        self.mode = self.modeStack.pop()
+        self.startModeTimer()
+        self.scheduleMode()
 
     def freightMode(self):
         if self.mode.name != "SPAWN" and self.mode.name != "GUIDE":
             if self.mode.name != "FREIGHT":
                 if self.mode.time is not None:
-                    dt = self.mode.time - self.modeTimer
+                    dt = self.mode.time - self.getModeTime()
                     self.modeStack.push(Mode(name=self.mode.name, time=dt))
                 else:
                     self.modeStack.push(Mode(name=self.mode.name))
-                self.mode = Mode("FREIGHT", time=7, speedMult=0.5)
-                self.modeTimer = 0
-            else:
-                self.mode = Mode("FREIGHT", time=7, speedMult=0.5)
-                self.modeTimer = 0
+            self.mode = Mode("FREIGHT", time=7, speedMult=0.5)
+            self.startModeTimer()
+            self.scheduleMode()
             self.reverseDirection()
 
     def spawnMode(self, speed=1):
         self.mode = Mode("SPAWN", speedMult=speed)
-        self.modeTimer = 0
+        self.startModeTimer()
+        self.scheduleMode()
         for d in self.guide:
             self.modeStack.push(Mode("GUIDE", speedMult=0.5, direction=d))
             
     def findSpawnNode(self):
-        for node in self.nodes.homeList:
-            if node.spawnNode:
-                break
-        return node
+        return self.nodes.getSpecialNode(SPAWNNODE)
     
     def spawnGoal(self):
-        self.goal = self.spawnNode.position
+        self.goal.set(self.spawnNode.position.x, self.spawnNode.position.y)
 
     def setGuideStack(self):
         self.guide = [UP]
@@ -261,7 +319,7 @@ class Ghost(Entity):
                 self.animation = self.animations["right"]
                 
         if self.mode.name == "FREIGHT":
-            if self.modeTimer >= (self.mode.time * 0.7):
+            if self.getModeTime() >= (self.mode.time * 0.7):
                 self.animation = self.animations["flash"]
             else:
                 self.animation = self.animations["freight"]
@@ -270,126 +328,166 @@ class Ghost(Entity):
                                                             
 
 class Blinky(Ghost):
-    def __init__(self, nodes, spritesheet):
-        Ghost.__init__(self, nodes, spritesheet)
+    def __init__(self, nodes, spritesheet, scheduler=None):
+        Ghost.__init__(self, nodes, spritesheet, scheduler)
         self.name = "blinky"
         self.color = RED
-        self.setStartPosition()
-        self.image = self.spritesheet.getImage(4,2,32,32)
         self.defineAnimations(2)
+        self.reset()
+
+    def reset(self, nodes=None):
+        Ghost.reset(self, nodes)
+        self.image = self.spritesheet.getImage(4,2,32,32)
         self.animation = self.animations["left"]
         
     def findStartNode(self):
-        for node in self.nodes.nodeList:
-            if node.blinkyStartNode:
-                return node
-        return None
+        return self.nodes.getSpecialNode(BLINKYSTART)
 
     
 class Pinky(Ghost):
-    def __init__(self, nodes, spritesheet):
-        Ghost.__init__(self, nodes, spritesheet)
+    def __init__(self, nodes, spritesheet, scheduler=None):
+        Ghost.__init__(self, nodes, spritesheet, scheduler)
         self.name = "pinky"
         self.color = PINK
-        self.setStartPosition()
-        self.image = self.spritesheet.getImage(0,3,32,32)
         self.defineAnimations(3)
+        self.reset()
+
+    def reset(self, nodes=None):
+        Ghost.reset(self, nodes)
+        self.image = self.spritesheet.getImage(0,3,32,32)
         self.animation = self.animations["up"]
         
     def scatterGoal(self):
-        self.goal = Vector2()
+        self.goal.set(0, 0)
         
     def chaseGoal(self, pacman, blinky=None):
-        self.goal = pacman.position + pacman.direction * TILEWIDTH * 4
+        self.goal.set(pacman.position.x + VECTORS[pacman.direction].x * TILEWIDTH * 4,
+                      pacman.position.y + VECTORS[pacman.direction].y * TILEWIDTH * 4)
 
     def findStartNode(self):
-        for node in self.nodes.nodeList:
-            if node.pinkyStartNode:
-                return node
-        return None
+        return self.nodes.getSpecialNode(PINKYSTART)
 
     
 class Inky(Ghost):
-    def __init__(self, nodes, spritesheet):
-        Ghost.__init__(self, nodes, spritesheet)
+    def __init__(self, nodes, spritesheet, scheduler=None):
+        Ghost.__init__(self, nodes, spritesheet, scheduler)
         self.name = "inky"
         self.color = TEAL
-        self.setStartPosition()
         self.pelletsForRelease = 30
+        self.defineAnimations(4)
+        self.reset()
+
+    def reset(self, nodes=None):
+        Ghost.reset(self, nodes)
         self.released = False
-        self.bannedDirections = [RIGHT]
+        self.bannedDirections.append(RIGHT)
         self.spawnNode = self.node
         self.image = self.spritesheet.getImage(2,4,32,32)
-        self.defineAnimations(4)
         self.animation = self.animations["down"]
         
     def setGuideStack(self):
         self.guide = [UP, RIGHT]
         
     def scatterGoal(self):
-        self.goal = Vector2(TILEWIDTH*NCOLS, TILEHEIGHT*NROWS)
+        self.goal.set(TILEWIDTH*NCOLS, TILEHEIGHT*NROWS)
         
     def chaseGoal(self, pacman, blinky=None):
-        vec1 = pacman.position + pacman.direction * TILEWIDTH * 2
-        vec2 = (vec1 - blinky.position) * 2
-        self.goal = blinky.position + vec2
+        x = pacman.position.x + VECTORS[pacman.direction].x * TILEWIDTH * 2
+        y = pacman.position.y + VECTORS[pacman.direction].y * TILEWIDTH * 2
+        self.goal.set(blinky.position.x + (x - blinky.position.x) * 2,
+                      blinky.position.y + (y - blinky.position.y) * 2)
 
     def findStartNode(self):
-        for node in self.nodes.nodeList:
-            if node.inkyStartNode:
-                return node
-        return None
+        return self.nodes.getSpecialNode(INKYSTART)
 
         
 class Clyde(Ghost):
-    def __init__(self, nodes, spritesheet):
-        Ghost.__init__(self, nodes, spritesheet)
+    def __init__(self, nodes, spritesheet, scheduler=None):
+        Ghost.__init__(self, nodes, spritesheet, scheduler)
         self.name = "clyde"
         self.color = ORANGE
-        self.setStartPosition()
         self.pelletsForRelease = 60
+        self.defineAnimations(5)
+        self.reset()
+
+    def reset(self, nodes=None):
+        Ghost.reset(self, nodes)
         self.released = False
-        self.bannedDirections = [LEFT]
+        self.bannedDirections.append(LEFT)
         self.spawnNode = self.node
         self.image = self.spritesheet.getImage(2,5,32,32)
-        self.defineAnimations(5)
         self.animation = self.animations["down"]
         
     def setGuideStack(self):
         self.guide = [UP, LEFT]
         
     def scatterGoal(self):
-        self.goal = Vector2(0, TILEHEIGHT*NROWS)
+        self.goal.set(0, TILEHEIGHT*NROWS)
         
     def chaseGoal(self, pacman, blinky=None):
-        d = pacman.position - self.position
-        ds = d.magnitudeSquared()
+        ds = pacman.position.distanceSquared(self.position)
         if ds <= (TILEWIDTH * 8)**2:
             self.scatterGoal()
         else:
-            self.goal = pacman.position + pacman.direction * TILEWIDTH * 4
+            self.goal.set(pacman.position.x + VECTORS[pacman.direction].x * TILEWIDTH * 4,
+                          pacman.position.y + VECTORS[pacman.direction].y * TILEWIDTH * 4)
 
     def findStartNode(self):
-        for node in self.nodes.nodeList:
-            if node.clydeStartNode:
-                return node
-        return None
+        return self.nodes.getSpecialNode(CLYDESTART)
     
 
 class GhostGroup(object):
-    def __init__(self, nodes, spritesheet):
+    def __init__(self, nodes, spritesheet, pathfinding=False, decisions=None, rng=None, scheduler=None):
         self.nodes = nodes
-        self.ghosts = [Blinky(nodes, spritesheet),
-                       Pinky(nodes, spritesheet),
-                       Inky(nodes, spritesheet),
-                       Clyde(nodes, spritesheet)]
+        if scheduler is None:
+            scheduler = Scheduler()
+        self.ghosts = [Blinky(nodes, spritesheet, scheduler),
+                       Pinky(nodes, spritesheet, scheduler),
+                       Inky(nodes, spritesheet, scheduler),
+                       Clyde(nodes, spritesheet, scheduler)]
+        self.byName = dict((ghost.name, ghost) for ghost in self.ghosts)
+        scheduler.register("ghostmode", self.nextMode)
+        # With pathfinding, eyes heading home follow the node graph's
+        # shortest path table instead of the greedy straight line choice.
+        # A DecisionCache passed in is shared by all four ghosts, and so is
+        # the game's random number generator when one is given.
+        self.pathfinding = pathfinding
+        self.loadPaths(nodes)
+        for ghost in self:
+            ghost.pathfinding = pathfinding
+            ghost.decisions = decisions
+            if rng is not None:
+                ghost.random = rng
         
     def __iter__(self):
         return iter(self.ghosts)
+
+    def loadPaths(self, nodes):
+        # The path table normally comes with the compiled maze.  A graph
+        # built without one has it computed here, at load time, rather than
+        # by the first ghost that needs it.
+        if self.pathfinding and nodes.distances is None:
+            nodes.computePaths()
+
+    def reset(self, nodes):
+        self.nodes = nodes
+        self.loadPaths(nodes)
+        for ghost in self:
+            ghost.reset(nodes)
+
+    def snapshot(self):
+        return tuple(ghost.snapshot() for ghost in self)
+
+    def restore(self, state):
+        for ghost, ghostState in zip(self.ghosts, state):
+            ghost.restore(ghostState)
     
     def update(self, dt, pacman):
         for ghost in self:
             ghost.update(dt, pacman, self.ghosts[0])
+
+    def nextMode(self, name):
+        self.byName[name].nextMode()
             
     def freightMode(self):
         for ghost in self:
@@ -416,8 +514,10 @@ class GhostGroup(object):
                     ghost.released = True
                     
     def render(self, screen):
+        rects = []
         for ghost in self:
-            ghost.render(screen)
+            rects.append(ghost.render(screen))
+        return rects
 
                                                                                                     
 
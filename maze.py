@@ -2,13 +2,23 @@ import pygame
 from constants import *
 
 class Maze(object):
+    """Builds maze backgrounds from the wall tiles on the sprite sheet.
+
+    Finished backgrounds are kept in a class level dict keyed by (maze name,
+    sprite row) and rotated tiles in another keyed by (sprite row, tile,
+    rotation), so each is only ever made once per process.
+    """
+    backgrounds = {}
+    tiles = {}
+
     def __init__(self, spritesheet):
         self.spritesheet = spritesheet
+        self.name = None
         self.spriteInfo = None
         self.rotateInfo = None
         self.images = []
-        self.flash_images = []
         self.imageRow = 16
+        self.partial = None
         
     def getMazeImages(self, row=0):
         self.images = []
@@ -17,6 +27,15 @@ class Maze(object):
             
     def rotate(self, image, value):
         return pygame.transform.rotate(image, value*90)
+
+    def getTile(self, row, val, rotVal):
+        key = (row, val, rotVal)
+        if key not in self.tiles:
+            if val == '=':
+                self.tiles[key] = self.images[10]
+            else:
+                self.tiles[key] = self.rotate(self.images[int(val)], int(rotVal))
+        return self.tiles[key]
     
     def readMazeFile(self, textfile):
         f = open(textfile, "r")
@@ -24,22 +43,63 @@ class Maze(object):
         return [line.split(' ') for line in lines]
     
     def getMaze(self, mazename):
+        self.name = mazename
         self.spriteInfo = self.readMazeFile(mazename+"_sprites.txt")
         self.rotateInfo = self.readMazeFile(mazename+"_rotation.txt")
+
+    def setMaze(self, spriteInfo, rotateInfo, mazename=None):
+        self.name = mazename
+        self.spriteInfo = spriteInfo
+        self.rotateInfo = rotateInfo
+        self.partial = None
         
     def constructMaze(self, background, row=0):
-        self.getMazeImages(row)
-        rows = len(self.spriteInfo)
+        self.constructRows(background, row, 0, len(self.spriteInfo))
+
+    def constructRows(self, background, spriteRow, start, end):
+        self.getMazeImages(spriteRow)
         cols = len(self.spriteInfo[0])
-        for row in range(rows):
+        for row in range(start, end):
             for col in range(cols):
                 x = col * TILEWIDTH
                 y = row * TILEHEIGHT
                 val = self.spriteInfo[row][col]
                 if val.isdecimal():
                     rotVal = self.rotateInfo[row][col]
-                    image = self.rotate(self.images[int(val)], int(rotVal))
-                    background.blit(image, (x, y))
+                    background.blit(self.getTile(spriteRow, val, rotVal), (x, y))
                     
                 if val == '=':
-                    background.blit(self.images[10], (x, y))
+                    background.blit(self.getTile(spriteRow, val, None), (x, y))
+
+    def newBackground(self):
+        background = pygame.surface.Surface(SCREENSIZE).convert()
+        background.fill(BLACK)
+        return background
+
+    def getBackground(self, row=0):
+        # The cached surface is shared, so callers that draw on it must copy.
+        key = (self.name, row)
+        if key not in self.backgrounds:
+            background = self.newBackground()
+            self.constructMaze(background, row)
+            self.backgrounds[key] = background
+        return self.backgrounds[key]
+
+    def prebuild(self, row, rows=4):
+        # Builds a few tile rows of a background per call, so one that is not
+        # needed yet can be spread over several frames.  Returns True once it
+        # is in the cache.
+        key = (self.name, row)
+        if key in self.backgrounds:
+            return True
+        if self.partial is None or self.partial[0] != key:
+            self.partial = (key, self.newBackground(), 0)
+        key, background, start = self.partial
+        end = min(start+rows, len(self.spriteInfo))
+        self.constructRows(background, row, start, end)
+        if end < len(self.spriteInfo):
+            self.partial = (key, background, end)
+            return False
+        self.backgrounds[key] = background
+        self.partial = None
+        return True
@@ -0,0 +1,108 @@
+import os
+import pickle
+import hashlib
+from maze import Maze
+from nodes import NodeGroup
+from pellets import PelletLayout
+
+# Bump whenever the layout of a compiled maze changes so stale files are
+# rebuilt instead of loaded.  The cache lives next to this module, so it is
+# shared whatever directory the game is started from.
+CACHEVERSION = 3
+CACHEDIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "__mazecache__")
+
+
+class CompiledMaze(object):
+    """Everything a level needs from its text files, already parsed.
+
+    nodeTable is the flat graph from NodeGroup.getTable, including its
+    shortest path tables, pelletLayout the
+    shared PelletLayout and spriteInfo/rotateInfo the tile grids for Maze.
+    """
+    def __init__(self, key, nodeTable, pelletLayout, spriteInfo, rotateInfo):
+        self.key = key
+        self.nodeTable = nodeTable
+        self.pelletLayout = pelletLayout
+        self.spriteInfo = spriteInfo
+        self.rotateInfo = rotateInfo
+
+
+class MazeCache(object):
+    """Compiles levels once and keeps them on disk and in memory.
+
+    A compiled level is a single pickle of plain tuples, lists and bytes,
+    named after a hash of its source files, so editing any of them simply
+    produces a new file and no class of the game is ever unpickled.  Levels already
+    loaded in this process are kept in a class level dict shared by every
+    MazeCache, so later level starts never touch the disk.
+    """
+    compiled = {}
+
+    def __init__(self, directory=CACHEDIR):
+        self.directory = directory
+
+    def load(self, levelmap):
+        name = (levelmap["mazename"], levelmap["pelletname"])
+        if name not in self.compiled:
+            self.compiled[name] = self.loadFile(levelmap)
+        return self.compiled[name]
+
+    def getSources(self, levelmap):
+        mazename = levelmap["mazename"].split(".")[0]
+        return [levelmap["mazename"], levelmap["pelletname"],
+                mazename+"_sprites.txt", mazename+"_rotation.txt"]
+
+    def getKey(self, levelmap):
+        digest = hashlib.sha1(str(CACHEVERSION).encode())
+        for filename in self.getSources(levelmap):
+            f = open(filename, "rb")
+            digest.update(f.read())
+            f.close()
+        return digest.hexdigest()
+
+    def getPath(self, levelmap, key):
+        mazename = levelmap["mazename"].split(".")[0]
+        return os.path.join(self.directory, "%s-%s.bin" % (mazename, key[:16]))
+
+    def loadFile(self, levelmap):
+        key = self.getKey(levelmap)
+        path = self.getPath(levelmap, key)
+        if os.path.exists(path):
+            try:
+                f = open(path, "rb")
+                data = pickle.loads(f.read())
+                f.close()
+                if data["version"] == CACHEVERSION and data["key"] == key:
+                    layout = PelletLayout(levelmap["pelletname"], data["pellets"])
+                    return CompiledMaze(key, data["nodes"], layout, data["sprites"], data["rotations"])
+            except Exception:
+                # Whatever is wrong with the file, building the level again
+                # is always possible.
+                pass
+        compiled = self.compile(levelmap, key)
+        self.save(path, compiled)
+        return compiled
+
+    def compile(self, levelmap, key):
+        maze = Maze(None)
+        maze.getMaze(levelmap["mazename"].split(".")[0])
+        nodes = NodeGroup(levelmap["mazename"])
+        nodes.computePaths()
+        layout = PelletLayout(levelmap["pelletname"])
+        return CompiledMaze(key, nodes.getTable(), layout, maze.spriteInfo, maze.rotateInfo)
+
+    def save(self, path, compiled):
+        data = {"version":CACHEVERSION, "key":compiled.key, "nodes":compiled.nodeTable,
+                "pellets":compiled.pelletLayout.getTable(), "sprites":compiled.spriteInfo,
+                "rotations":compiled.rotateInfo}
+        # Write to a private name first so worker processes racing to build
+        # the same level never see a half written file.
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            temp = "%s.%d" % (path, os.getpid())
+            f = open(temp, "wb")
+            f.write(pickle.dumps(data, pickle.HIGHEST_PROTOCOL))
+            f.close()
+            os.replace(temp, path)
+        except OSError:
+            pass
@@ -1,6 +1,14 @@
+# Ghost mode schedule in the order the modes are played.  The last mode has no
+# time limit and stays at the bottom of the mode stack.
+MODESCHEDULE = [("SCATTER", 7), ("CHASE", 20), ("SCATTER", 7), ("CHASE", 20),
+                ("SCATTER", 7), ("CHASE", 20), ("SCATTER", 5), ("CHASE", None)]
+
 class Mode(object):
     def __init__(self, name="", time=None, speedMult=1, direction=None):
         self.name = name
         self.time = time
         self.speedMult = speedMult
         self.direction = direction
+
+    def snapshot(self):
+        return (self.name, self.time, self.speedMult, self.direction)
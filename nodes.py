@@ -1,27 +1,57 @@
 import pygame
+from heapq import heappush, heappop
 from vector import Vector2
 from constants import *
-from stack import Stack
+
+# Bits of Node.flags.  The order is also the one used by compiled node tables.
+HOMEGUIDE = 1 << 0
+HOMEENTRANCE = 1 << 1
+SPAWNNODE = 1 << 2
+PACMANSTART = 1 << 3
+BLINKYSTART = 1 << 4
+PINKYSTART = 1 << 5
+INKYSTART = 1 << 6
+CLYDESTART = 1 << 7
+FRUITSTART = 1 << 8
+NODEFLAGS = [HOMEGUIDE, HOMEENTRANCE, SPAWNNODE, PACMANSTART, BLINKYSTART,
+             PINKYSTART, INKYSTART, CLYDESTART, FRUITSTART]
+
+def flagProperty(flag):
+    # Lets node.spawnNode and friends keep working on top of the bitfield.
+    def get(self):
+        return self.flags & flag != 0
+    def set(self, value):
+        if value:
+            self.flags |= flag
+        else:
+            self.flags &= ~flag
+    return property(get, set)
+
 
 class Node(object):
+    __slots__ = ("row", "column", "position", "neighbors", "portalNode", "portalVal", "flags", "index")
+
+    homeGuide = flagProperty(HOMEGUIDE)
+    homeEntrance = flagProperty(HOMEENTRANCE)
+    spawnNode = flagProperty(SPAWNNODE)
+    pacmanStartNode = flagProperty(PACMANSTART)
+    blinkyStartNode = flagProperty(BLINKYSTART)
+    pinkyStartNode = flagProperty(PINKYSTART)
+    inkyStartNode = flagProperty(INKYSTART)
+    clydeStartNode = flagProperty(CLYDESTART)
+    fruitStartNode = flagProperty(FRUITSTART)
+
     def __init__(self, row, column):
         self.row, self.column = row, column
         self.position = Vector2(column*TILEWIDTH, row*TILEHEIGHT)
-        self.neighbors = {UP:None, DOWN:None, LEFT:None, RIGHT:None}
+        self.neighbors = [None, None, None, None]
         self.portalNode = None
         self.portalVal = 0
-        self.homeGuide = False
-        self.homeEntrance = False
-        self.spawnNode = False
-        self.pacmanStartNode = False
-        self.blinkyStartNode = False
-        self.pinkyStartNode = False
-        self.inkyStartNode = False
-        self.clydeStartNode = False
-        self.fruitStartNode = False
+        self.flags = 0
+        self.index = None
         
     def render(self, screen):
-        for n in self.neighbors.keys():
+        for n in DIRECTIONS:
             if self.neighbors[n] is not None:
                 line_start = self.position.asTuple()
                 line_end = self.neighbors[n].position.asTuple()
@@ -30,20 +60,36 @@ class Node(object):
 
 
 class NodeGroup(object):
-    def __init__(self, level):
+    def __init__(self, level, table=None):
         self.nodeList = []
         self.homeList = []
+        self.nodePositions = {}
         self.level = level
-        self.nodeStack = Stack()
+        self.distances = None
+        self.nextHop = None
+        self.specialNodes = {}
         self.portalSymbols = ["1"]
         self.nodeSymbols = ["+", "H", "S", "P", "B", "I", "C", "F"] + self.portalSymbols
+        self.nodeSymbolSet = set(self.nodeSymbols)
+        self.symbolFlags = {"H":HOMEGUIDE, "S":SPAWNNODE | PINKYSTART, "P":PACMANSTART, "B":BLINKYSTART,
+                            "I":INKYSTART, "C":CLYDESTART, "F":FRUITSTART}
+        self.steps = {LEFT:(0, -1), RIGHT:(0, 1), UP:(-1, 0), DOWN:(1, 0)}
+        self.pathSymbols = {LEFT:self.nodeSymbolSet | {"-"}, RIGHT:self.nodeSymbolSet | {"-"},
+                            UP:self.nodeSymbolSet | {"|"}, DOWN:self.nodeSymbolSet | {"|"}}
+        if table is not None:
+            self.loadTable(table)
+            return
         self.grid = self.readMazeFile(level)
         self.homegrid = self.getHomeArray()
-        self.createNodeList(self.grid, self.nodeList)
-        self.createNodeList(self.homegrid, self.homeList)
+        self.nodeTable = self.createNodeTable(self.grid, self.nodeList)
+        self.homeTable = self.createNodeTable(self.homegrid, self.homeList)
+        for node in self.nodeList:
+            self.nodePositions[node.position.asTuple()] = node
         self.setupPortalNodes()
         self.moveHomeNodes()
         self.homeList[0].homeEntrance = True
+        self.indexNodes()
+        self.indexSpecialNodes()
         
     def readMazeFile(self, textfile):
         f = open(textfile, "r")
@@ -57,114 +103,67 @@ class NodeGroup(object):
                 ['+', '0', '|', '0', '+'],
                 ['I', '-', 'S', '-', 'C'],
                 ['+', '0', '0', '0', '+']]
-            
-    def createNodeList(self, grid, nodeList):
-        startNode = self.findFirstNode(grid)
-        self.nodeStack.push(startNode)
-        while not self.nodeStack.isEmpty():
-            node = self.nodeStack.pop()
-            self.addNode(node, nodeList)
-            leftNode = self.getPathNode(LEFT, node.row, node.column-1, nodeList, grid)
-            rightNode = self.getPathNode(RIGHT, node.row, node.column+1, nodeList, grid)
-            upNode = self.getPathNode(UP, node.row-1, node.column, nodeList, grid)
-            downNode = self.getPathNode(DOWN, node.row+1, node.column, nodeList, grid)
-            node.neighbors[LEFT] = leftNode
-            node.neighbors[RIGHT] = rightNode
-            node.neighbors[UP] = upNode
-            node.neighbors[DOWN] = downNode
-            self.addNodeToStack(leftNode, nodeList)
-            self.addNodeToStack(rightNode, nodeList)
-            self.addNodeToStack(upNode, nodeList)
-            self.addNodeToStack(downNode, nodeList)
-
-    def findFirstNode(self, grid):
+
+    def createNodeTable(self, grid, nodeList):
+        # One pass creates every node keyed by (row, col), a second follows
+        # the paths out of each node and links the neighbours by key.
+        nodeTable = {}
         rows = len(grid)
         cols = len(grid[0])
-        nodeFound = False
         for row in range(rows):
             for col in range(cols):
-                if grid[row][col] in self.nodeSymbols:
-                    node = Node(row, col)
-                    if grid[row][col] == "B":
-                        node.blinkyStartNode = True
-                    if grid[row][col] in self.portalSymbols:
-                        node.portalVal = grid[row][col]
-                    return node
-        return None
-    
-    def getNode(self, x, y, nodeList=[]):
-        for node in nodeList:
-            if node.position.x == x and node.position.y == y:
-                return node
-        return None
-    
-    def getNodeFromNode(self, node, nodeList):
-        if node is not None:
-            for inode in nodeList:
-                if node.row == inode.row and node.column == inode.column:
-                    return inode
+                if grid[row][col] in self.nodeSymbolSet:
+                    node = self.createNode(row, col, grid[row][col])
+                    nodeTable[(row, col)] = node
+                    nodeList.append(node)
+        for key in nodeTable.keys():
+            node = nodeTable[key]
+            for direction in self.steps.keys():
+                pathEnd = self.followPath(direction, key[0], key[1], grid)
+                if pathEnd is not None:
+                    node.neighbors[direction] = nodeTable[pathEnd]
+        return nodeTable
+
+    def createNode(self, row, col, symbol):
+        node = Node(row, col)
+        node.flags = self.symbolFlags.get(symbol, 0)
+        if symbol in self.portalSymbols:
+            node.portalVal = symbol
         return node
     
-    def getPathNode(self, direction, row, col, nodeList, grid):
-        tempNode = self.followPath(direction, row, col, grid)
-        return self.getNodeFromNode(tempNode, nodeList)
+    def getNode(self, x, y):
+        return self.nodePositions.get((x, y))
+
+    def indexSpecialNodes(self):
+        # The first node carrying each flag, so start nodes are found
+        # without scanning the graph.
+        self.specialNodes = {}
+        for node in self.getAllNodes():
+            for flag in NODEFLAGS:
+                if node.flags & flag and flag not in self.specialNodes:
+                    self.specialNodes[flag] = node
+
+    def getSpecialNode(self, flag):
+        return self.specialNodes.get(flag)
 
     def addNode(self, node, nodeList):
-        nodeInList = self.nodeInList(node, nodeList)
-        if not nodeInList:
+        key = node.position.asTuple()
+        if key not in self.nodePositions:
+            self.nodePositions[key] = node
             nodeList.append(node)
-            
-    def addNodeToStack(self, node, nodeList):
-        if node is not None and not self.nodeInList(node, nodeList):
-            self.nodeStack.push(node)
-            
-    def nodeInList(self, node, nodeList):
-        for inode in nodeList:
-            if node.position.x == inode.position.x and node.position.y == inode.position.y:
-                return True
-        return False
 
     def followPath(self, direction, row, col, grid):
-        rows = len(grid)
-        columns = len(grid[0])
-        if direction == LEFT and col >= 0:
-            return self.pathToFollow(LEFT, row, col, "-", grid)
-        elif direction == RIGHT and col < columns:
-            return self.pathToFollow(RIGHT, row, col, "-", grid)
-        elif direction == UP and row >= 0:
-            return self.pathToFollow(UP, row, col, "|", grid)
-        elif direction == DOWN and row < rows:
-            return self.pathToFollow(DOWN, row, col, "|", grid)
-        else:
+        dr, dc = self.steps[direction]
+        row += dr
+        col += dc
+        if row < 0 or row >= len(grid) or col < 0 or col >= len(grid[0]):
             return None
-        
-    def pathToFollow(self, direction, row, col, path, grid):
-        tempSymbols = [path]+self.nodeSymbols
-        if grid[row][col] in tempSymbols:
-            while grid[row][col] not in self.nodeSymbols:
-                if direction is LEFT: col -= 1
-                elif direction is RIGHT: col += 1
-                elif direction is UP: row -= 1
-                elif direction is DOWN: row += 1
-            node = Node(row, col)
-            if grid[row][col] == "H":
-                node.homeGuide = True
-            if grid[row][col] == "S":
-                node.spawnNode = True
-                node.pinkyStartNode = True
-            if grid[row][col] == "P":
-                node.pacmanStartNode = True
-            if grid[row][col] == "I":
-                node.inkyStartNode = True
-            if grid[row][col] == "C":
-                node.clydeStartNode = True
-            if grid[row][col] == "F":
-                node.fruitStartNode = True
-            if grid[row][col] in self.portalSymbols:
-                node.portalVal = grid[row][col]
-            return node
-        else:
+        if grid[row][col] not in self.pathSymbols[direction]:
             return None
+        while grid[row][col] not in self.nodeSymbolSet:
+            row += dr
+            col += dc
+        return row, col
 
     def setupPortalNodes(self):
         portalDict = {}
@@ -193,14 +192,158 @@ class NodeGroup(object):
             node.position += mid
             self.addNode(node, self.nodeList)
 
-        A = self.getNodeFromNode(nodeA, self.nodeList)
-        B = self.getNodeFromNode(nodeB, self.nodeList)
-        H = self.getNodeFromNode(self.homeList[0], self.nodeList)
-        A.neighbors[LEFT] = H
-        B.neighbors[RIGHT] = H
-        H.neighbors[RIGHT] = A
-        H.neighbors[LEFT] = B
+        H = self.homeList[0]
+        nodeA.neighbors[LEFT] = H
+        nodeB.neighbors[RIGHT] = H
+        H.neighbors[RIGHT] = nodeA
+        H.neighbors[LEFT] = nodeB
         
+    def getTable(self):
+        # Flattens the finished graph into plain tuples that pickle without
+        # any Node or Vector2 objects.  Nodes are referred to by their index.
+        nodes = self.getAllNodes()
+        index = {}
+        for i in range(len(nodes)):
+            index[nodes[i]] = i
+        table = {"nodes":[], "neighbors":[], "portals":[]}
+        for node in nodes:
+            table["nodes"].append((node.row, node.column, node.position.x, node.position.y, node.flags, node.portalVal))
+            table["neighbors"].append(tuple(-1 if neighbor is None else index[neighbor]
+                                            for neighbor in node.neighbors))
+            table["portals"].append(-1 if node.portalNode is None else index[node.portalNode])
+        table["count"] = len(self.nodeList)
+        table["grid"] = len(self.nodeTable)
+        table["home"] = [index[node] for node in self.homeList]
+        if self.distances is not None:
+            table["distances"] = self.distances
+            table["nextHop"] = self.nextHop
+        return table
+
+    def loadTable(self, table):
+        nodes = []
+        for row, col, x, y, flags, portalVal in table["nodes"]:
+            node = Node(row, col)
+            node.position = Vector2(x, y)
+            node.portalVal = portalVal
+            node.flags = flags
+            nodes.append(node)
+        for i in range(len(nodes)):
+            neighbors = table["neighbors"][i]
+            for d in DIRECTIONS:
+                if neighbors[d] != -1:
+                    nodes[i].neighbors[d] = nodes[neighbors[d]]
+            if table["portals"][i] != -1:
+                nodes[i].portalNode = nodes[table["portals"][i]]
+        self.grid = None
+        self.homegrid = None
+        self.nodeList = nodes[:table["count"]]
+        self.homeList = [nodes[i] for i in table["home"]]
+        self.nodeTable = {}
+        for node in self.nodeList[:table["grid"]]:
+            self.nodeTable[(node.row, node.column)] = node
+        self.homeTable = {}
+        for node in self.homeList:
+            self.homeTable[(node.row, node.column)] = node
+        for node in self.nodeList:
+            self.nodePositions[node.position.asTuple()] = node
+        self.indexNodes()
+        if "distances" in table:
+            self.distances = table["distances"]
+            self.nextHop = table["nextHop"]
+        self.indexSpecialNodes()
+
+    def getAllNodes(self):
+        return self.nodeList + [node for node in self.homeList if node not in self.nodeList]
+
+    def indexNodes(self):
+        # Numbers every node and lists, per direction, the edge length and
+        # the node a ghost actually stands on after taking it, which is the
+        # far side of a portal when the neighbour is one.
+        nodes = self.getAllNodes()
+        for i in range(len(nodes)):
+            nodes[i].index = i
+        self.allNodes = nodes
+        self.pathEdges = []
+        for node in nodes:
+            edges = []
+            for direction in DIRECTIONS:
+                neighbor = node.neighbors[direction]
+                if neighbor is None:
+                    edges.append(None)
+                else:
+                    weight = (neighbor.position - node.position).magnitude()
+                    landing = neighbor.portalNode if neighbor.portalNode is not None else neighbor
+                    edges.append((neighbor.index, weight, landing.index))
+            self.pathEdges.append(edges)
+        return nodes
+
+    def computePaths(self):
+        # distances[s][t] is the shortest travel from standing on node s to
+        # reaching node t, either by arriving at it or by landing on it out
+        # of a portal.  nextHop[s][t] is the direction of the first move, or
+        # -1 when s is t or t cannot be reached.
+        nodes = self.indexNodes()
+        count = len(nodes)
+        self.distances = []
+        for source in range(count):
+            standing = [float("inf")] * count
+            arriving = [float("inf")] * count
+            standing[source] = 0
+            arriving[source] = 0
+            heap = [(0, source)]
+            while heap:
+                distance, index = heappop(heap)
+                if distance > standing[index]:
+                    continue
+                for edge in self.pathEdges[index]:
+                    if edge is not None:
+                        neighbor, weight, landing = edge
+                        total = distance + weight
+                        if total < arriving[neighbor]:
+                            arriving[neighbor] = total
+                        if total < arriving[landing]:
+                            arriving[landing] = total
+                        if total < standing[landing]:
+                            standing[landing] = total
+                            heappush(heap, (total, landing))
+            self.distances.append(arriving)
+        self.nextHop = []
+        for source in range(count):
+            row = []
+            for target in range(count):
+                costs = self.getPathCosts(source, target)
+                best = min(costs)
+                row.append(-1 if source == target or best == float("inf") else costs.index(best))
+            self.nextHop.append(row)
+
+    def getPathCosts(self, source, target):
+        costs = []
+        for edge in self.pathEdges[source]:
+            if edge is None:
+                costs.append(float("inf"))
+            elif edge[0] == target or edge[2] == target:
+                costs.append(edge[1])
+            else:
+                costs.append(edge[1] + self.distances[edge[2]][target])
+        return costs
+
+    def getPathDirection(self, node, goal, validDirections):
+        # Of the directions allowed, the one on the shortest path to goal.
+        # Usually that is the table's first move.  Only when it is not
+        # allowed, say behind a reverse ban or a closed home gate, are the
+        # costs of the other directions worked out.
+        hop = self.nextHop[node.index][goal.index]
+        if hop in validDirections:
+            return hop
+        costs = self.getPathCosts(node.index, goal.index)
+        best = validDirections[0]
+        bestCost = costs[best]
+        for direction in validDirections[1:]:
+            cost = costs[direction]
+            if cost < bestCost:
+                best, bestCost = direction, cost
+        return best
+
     def render(self, screen):
         for node in self.nodeList:
             node.render(screen)
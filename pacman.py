@@ -3,6 +3,7 @@ from pygame.locals import *
 from vector import Vector2
 from constants import *
 from entity import Entity
+from nodes import PACMANSTART
 from animation import Animation
 
 class Pacman(Entity):
@@ -26,6 +27,17 @@ class Pacman(Entity):
         self.dying = False
         self.animations["death"].reset()
 
+    def snapshot(self):
+        death = self.animations["death"]
+        return (Entity.snapshot(self), self.lives, self.dying,
+                death.current_frame, death.dt, death.finished)
+
+    def restore(self, state):
+        entity, self.lives, self.dying, frame, dt, finished = state
+        Entity.restore(self, entity)
+        death = self.animations["death"]
+        death.current_frame, death.dt, death.finished = frame, dt, finished
+
     def loseLife(self):
         self.lives -= 1
 
@@ -35,17 +47,18 @@ class Pacman(Entity):
         self.animations["death"].reset()
 
     def renderLives(self, screen):
+        rects = []
         for i in range(self.lives-1):
             x = 10 + 36 * i
             y = TILEHEIGHT * NROWS - 36
-            screen.blit(self.lifeicons, (x, y))
+            rects.append(screen.blit(self.lifeicons, (x, y)))
+        return rects
 
-    def update(self, dt):
+    def update(self, dt, direction=None):
         self.visible = True
-        self.position += self.direction*self.speed*dt
+        self.position.addScaled(VECTORS[self.direction], self.speed*dt)
         self.updateAnimation(dt)
-        direction = self.getValidKey()
-        if direction:
+        if direction is not None:
             self.moveByKey(direction)
         else:
             self.moveBySelf()
@@ -63,12 +76,12 @@ class Pacman(Entity):
         return None
 
     def moveByKey(self, direction):
-        if self.direction is STOP:
+        if self.direction == STOP:
             if self.node.neighbors[direction] is not None:
                 self.target = self.node.neighbors[direction]
                 self.direction = direction
         else:
-            if direction == self.direction * -1:
+            if direction == OPPOSITE[self.direction]:
                 self.reverseDirection()
             if self.overshotTarget():
                 self.node = self.target
@@ -92,37 +105,8 @@ class Pacman(Entity):
                         self.setPosition()
                         self.direction = STOP
 
-    def eatPellets(self, pelletList):
-        for pellet in pelletList:
-            d = self.position - pellet.position
-            dSquared = d.magnitudeSquared()
-            rSquared = (pellet.radius+self.collideRadius)**2
-            if dSquared <= rSquared:
-                return pellet
-        return None
-
-    def eatGhost(self, ghosts):
-        for ghost in ghosts:
-            d = self.position - ghost.position
-            dSquared = d.magnitudeSquared()
-            rSquared = (self.collideRadius + ghost.collideRadius)**2
-            if dSquared <= rSquared:
-                return ghost
-        return None
-
-    def eatFruit(self, fruit):
-        d = self.position - fruit.position
-        dSquared = d.magnitudeSquared()
-        rSquared = (self.collideRadius+fruit.collideRadius)**2
-        if dSquared <= rSquared:
-            return True
-        return False
-
     def findStartNode(self):
-        for node in self.nodes.nodeList:
-            if node.pacmanStartNode:
-                return node
-        return None
+        return self.nodes.getSpecialNode(PACMANSTART)
 
     def setStartPosition(self):
         self.direction = LEFT
@@ -132,8 +116,7 @@ class Pacman(Entity):
         self.position.x -= (self.node.position.x - self.target.position.x) / 2
 
     def getSprite(self, col, row):
-        img = self.spritesheet.getImage(col, row, 32, 32)
-        return pygame.transform.scale(img, (28, 28))
+        return self.spritesheet.getImage(col, row, 32, 32, (28, 28))
 
     def defineAnimations(self):
         # Sprite layout (32x32 native, scaled to 28x28):
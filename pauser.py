@@ -1,38 +1,60 @@
+from scheduler import Scheduler, PLAY, PAUSE
+
 class Pauser(object):
-    def __init__(self, paused=False):
-        self.paused = paused
-        self.timer = 0
+    # A timed pause is an "unpause" event on the scheduler's PAUSE timeline.
+    # The PLAY timeline is suspended for as long as the game is paused.
+    def __init__(self, paused=False, scheduler=None):
+        if scheduler is None:
+            scheduler = Scheduler()
+        self.scheduler = scheduler
+        self.scheduler.register("unpause", self.unpause)
         self.pauseTime = 0
-        self.playerPaused = paused
         self.pauseType = None  #(clear, die, ghost)
+        self.force(paused)
         
-    def update(self, dt):
-        if not self.playerPaused:
-            if self.paused:
-                self.timer += dt
-                if self.timer >= self.pauseTime:
-                    self.timer = 0
-                    self.paused = False
+    def unpause(self, target=None):
+        self.paused = False
+        self.scheduler.resume(PLAY)
+        self.scheduler.suspend(PAUSE)
                     
     def startTimer(self, pauseTime, pauseType=None):
         self.pauseTime = pauseTime
         self.pauseType = pauseType
-        self.timer = 0
         self.paused = True
+        self.scheduler.cancel(PAUSE, "unpause")
+        self.scheduler.schedule(PAUSE, pauseTime, "unpause")
+        self.scheduler.suspend(PLAY)
+        self.scheduler.resume(PAUSE)
         
     def player(self):
         self.playerPaused = not self.playerPaused
         if self.playerPaused:
             self.paused = True
+            self.scheduler.suspend(PLAY)
+            self.scheduler.suspend(PAUSE)
         else:
-            self.paused = False
+            # Unpausing also cuts a timed pause short.
+            self.scheduler.cancel(PAUSE, "unpause")
+            self.unpause()
             
     def force(self, pause):
         self.paused = pause
         self.playerPaused = pause
-        self.timer = 0
         self.pauseTime = 0
+        self.pauseType = None
+        self.scheduler.cancel(PAUSE, "unpause")
+        self.scheduler.suspend(PAUSE)
+        if pause:
+            self.scheduler.suspend(PLAY)
+        else:
+            self.scheduler.resume(PLAY)
         
+    def snapshot(self):
+        return (self.paused, self.pauseTime, self.playerPaused, self.pauseType)
+
+    def restore(self, state):
+        self.paused, self.pauseTime, self.playerPaused, self.pauseType = state
+
     def settlePause(self, gamecontroller):
         if self.pauseType == "die":
             gamecontroller.resolveDeath()
@@ -1,76 +1,182 @@
 import pygame
-from vector import Vector2
 from constants import *
+from scheduler import HUD
 
 class Pellet(object):
-    def __init__(self, x, y):
+    def __init__(self):
         self.name = "pellet"
-        self.position = Vector2(x, y)
         self.color = WHITE
         #self.radius = 4
         self.radius = 2
         self.points = 10
-        self.visible = True
-        
-    def render(self, screen):
-        if self.visible:
-            p = self.position.asInt()
-            p = (int(p[0]+TILEWIDTH/2), int(p[1]+TILEWIDTH/2))
-            pygame.draw.circle(screen, self.color, p, self.radius)
+
+    def render(self, screen, x, y):
+        p = (int(x+TILEWIDTH/2), int(y+TILEWIDTH/2))
+        return pygame.draw.circle(screen, self.color, p, self.radius)
 
 
 class PowerPellet(Pellet):
-    def __init__(self, x, y):
-        Pellet.__init__(self, x, y)
+    def __init__(self):
+        Pellet.__init__(self)
         self.name = "powerpellet"
         self.radius = 8
         self.points = 50
-        self.flashTime = 0.2
-        self.timer= 0
-        
-    def update(self, dt):
-        self.timer += dt
-        if self.timer >= self.flashTime:
-            self.visible = not self.visible
-            self.timer = 0
 
 
-class PelletGroup(object):
-    def __init__(self, pelletfile):
-        self.pelletList = []
-        self.powerpellets = []
-        #self.pelletSymbols = ["p", "n", "Y"]
-        #self.powerpelletSymbols = ["P", "N"]
-        self.createPelletList(pelletfile)
-        
-    def update(self, dt):
-        for powerpellet in self.powerpellets:
-            powerpellet.update(dt)
-                
-    def createPelletList(self, pelletfile):
-        grid = self.readPelletfile(pelletfile)        
+class PelletLayout(object):
+    """The pellet layout of a pellet file.
+
+    Layouts are parsed once per file and shared by every PelletGroup, which
+    only copies the flat per-tile pellet mask.  A table from getTable
+    rebuilds the layout without reading the file.
+    """
+    layouts = {}
+
+    def __init__(self, pelletfile, table=None):
+        if table is None:
+            table = self.parse(self.readPelletfile(pelletfile))
+        self.rows, self.cols, self.tiles, self.power = table
+        self.indices = [i for i in range(len(self.tiles)) if self.tiles[i]]
+        self.powerIndices = [i for i in range(len(self.power)) if self.power[i]]
+        self.numPellets = len(self.indices)
+
+    def parse(self, grid):
         rows = len(grid)
         cols = len(grid[0])
+        tiles = bytearray(rows * cols)
+        power = bytearray(rows * cols)
         for row in range(rows):
             for col in range(cols):
                 if grid[row][col] == 'p':
-                    self.pelletList.append(Pellet(col*TILEWIDTH, row*TILEHEIGHT))
+                    tiles[row*cols + col] = 1
                 elif grid[row][col] == 'P':
-                    pp = PowerPellet(col*TILEWIDTH, row*TILEHEIGHT)
-                    self.pelletList.append(pp)
-                    self.powerpellets.append(pp)
-                    
+                    tiles[row*cols + col] = 1
+                    power[row*cols + col] = 1
+        return (rows, cols, bytes(tiles), bytes(power))
+
+    def getTable(self):
+        return (self.rows, self.cols, self.tiles, self.power)
+
+    @classmethod
+    def load(cls, pelletfile):
+        if pelletfile not in cls.layouts:
+            cls.layouts[pelletfile] = cls(pelletfile)
+        return cls.layouts[pelletfile]
+
     def readPelletfile(self, textfile):
         f = open(textfile, "r")
         lines = [line.rstrip('\n') for line in f]
         lines = [line.rstrip('\r') for line in lines]
         return [line.split(' ') for line in lines]
-    
+
+    def getPosition(self, index):
+        row, col = divmod(index, self.cols)
+        return col*TILEWIDTH, row*TILEHEIGHT
+
+
+class PelletGroup(object):
+    def __init__(self, pelletfile, layout=None):
+        if layout is None:
+            layout = PelletLayout.load(pelletfile)
+        self.pelletfile = pelletfile
+        self.layout = layout
+        self.tiles = bytearray(self.layout.tiles)
+        self.numPellets = self.layout.numPellets
+        self.pellet = Pellet()
+        self.powerpellet = PowerPellet()
+        self.flashTime = 0.2
+        self.powerVisible = True
+        self.layer = None
+        self.powerImage = None
+        self.scheduler = None
+
+    def startBlinking(self, scheduler):
+        # The power pellets blink on a "blink" event that keeps rescheduling
+        # itself on the HUD timeline.
+        self.scheduler = scheduler
+        scheduler.register("blink", self.blink)
+        scheduler.cancel(HUD, "blink")
+        scheduler.schedule(HUD, self.flashTime, "blink")
+
+    def blink(self, target=None):
+        self.powerVisible = not self.powerVisible
+        self.scheduler.schedule(HUD, self.flashTime, "blink")
+
+    def getPellet(self, index):
+        if self.layout.power[index]:
+            return self.powerpellet
+        return self.pellet
+
+    def getNearbyPellets(self, position):
+        # Pellets are smaller than a tile, so anything Pac-Man can touch sits
+        # in his tile or one of the eight around it.
+        layout = self.layout
+        row = int(position.y // TILEHEIGHT)
+        col = int(position.x // TILEWIDTH)
+        nearby = []
+        for r in (row-1, row, row+1):
+            if 0 <= r < layout.rows:
+                for c in (col-1, col, col+1):
+                    if 0 <= c < layout.cols and self.tiles[r*layout.cols + c]:
+                        nearby.append(r*layout.cols + c)
+        return nearby
+
+    def removePellet(self, index):
+        self.tiles[index] = 0
+        self.numPellets -= 1
+        pellet = self.getPellet(index)
+        if self.layer is not None and pellet is self.pellet:
+            self.layer.fill(BLACK, self.getPelletRect(index))
+        return pellet
+
+    def getPelletRect(self, index):
+        x, y = self.layout.getPosition(index)
+        r = self.pellet.radius + 1
+        return pygame.Rect(x+TILEWIDTH//2-r, y+TILEHEIGHT//2-r, 2*r+1, 2*r+1)
+
+    def setLayer(self, surface):
+        # Normal pellets never move, so they are drawn once into the maze
+        # background and erased tile by tile as they are eaten.  Only the
+        # blinking power pellets are drawn every frame, from one prerendered
+        # image.
+        self.layer = surface
+        layout = self.layout
+        for index in layout.indices:
+            if self.tiles[index] and not layout.power[index]:
+                x, y = layout.getPosition(index)
+                self.pellet.render(surface, x, y)
+        self.powerImage = pygame.Surface((TILEWIDTH+1, TILEHEIGHT+1))
+        self.powerImage.fill(TRANSPARENT)
+        self.powerImage.set_colorkey(TRANSPARENT)
+        self.powerpellet.render(self.powerImage, 0, 0)
+
     def isEmpty(self):
-        if len(self.pelletList) == 0:
-            return True
-        return False
-    
+        return self.numPellets == 0
+
+    def snapshot(self):
+        return (bytes(self.tiles), self.powerVisible)
+
+    def restore(self, state):
+        tiles, self.powerVisible = state
+        if self.layer is not None:
+            # Only the pellets that differ are drawn back or erased, so the
+            # background stays in step without being rebuilt.
+            layout = self.layout
+            for index in layout.indices:
+                if tiles[index] != self.tiles[index] and not layout.power[index]:
+                    if tiles[index]:
+                        x, y = layout.getPosition(index)
+                        self.pellet.render(self.layer, x, y)
+                    else:
+                        self.layer.fill(BLACK, self.getPelletRect(index))
+        self.tiles[:] = tiles
+        self.numPellets = self.tiles.count(1)
+
     def render(self, screen):
-        for pellet in self.pelletList:
-            pellet.render(screen)
+        rects = []
+        if self.powerVisible:
+            layout = self.layout
+            for index in layout.powerIndices:
+                if self.tiles[index]:
+                    rects.append(screen.blit(self.powerImage, layout.getPosition(index)))
+        return rects
@@ -0,0 +1,133 @@
+import json
+from time import perf_counter
+from constants import *
+from text import Text
+
+class FrameProfiler(object):
+    """Wall clock time per phase of each frame, kept in a ring buffer.
+
+    GameController calls startFrame, then mark(name) right after each phase
+    finishes, then endFrame.  Each mark is charged the time since the one
+    before it, so a frame costs one perf_counter call per phase.
+    """
+    def __init__(self, size=900, overlay=False, refresh=15, path=None):
+        self.size = size
+        self.path = path
+        self.samples = {}
+        self.phases = []
+        self.current = {}
+        self.frames = 0
+        self.last = perf_counter()
+        self.frameStart = self.last
+        self.overlay = overlay
+        self.refresh = refresh
+        self.lines = []
+        self.version = 0
+
+    def startFrame(self):
+        self.last = perf_counter()
+        self.frameStart = self.last
+
+    def mark(self, name):
+        now = perf_counter()
+        self.current[name] = self.current.get(name, 0.0) + now - self.last
+        self.last = now
+
+    def endFrame(self):
+        now = perf_counter()
+        slot = self.frames % self.size
+        self.current["frame"] = now - self.frameStart
+        for name in self.current.keys():
+            if name not in self.samples:
+                self.samples[name] = [0.0] * self.size
+                self.phases.append(name)
+        # Phases that did not run this frame, such as render when headless,
+        # are recorded as zero so every buffer stays in step.
+        for name in self.phases:
+            self.samples[name][slot] = self.current.get(name, 0.0)
+        self.current = {}
+        self.frames += 1
+        self.last = now
+
+    def getSamples(self, name):
+        if name not in self.samples:
+            return []
+        count = min(self.frames, self.size)
+        return self.samples[name][:count]
+
+    def percentile(self, name, percent):
+        samples = sorted(self.getSamples(name))
+        if len(samples) == 0:
+            return 0.0
+        index = int(round(percent / 100.0 * (len(samples) - 1)))
+        return samples[index]
+
+    def summary(self):
+        results = {}
+        for name in self.phases:
+            samples = self.getSamples(name)
+            results[name] = {"p50":self.percentile(name, 50),
+                             "p95":self.percentile(name, 95),
+                             "p99":self.percentile(name, 99),
+                             "mean":sum(samples) / len(samples),
+                             "max":max(samples)}
+        return results
+
+    def dump(self, path=None):
+        path = path or self.path
+        if path is None:
+            return
+        f = open(path, "w")
+        json.dump({"frames":self.frames, "window":min(self.frames, self.size),
+                   "seconds":self.summary()}, f, indent=2, sort_keys=True)
+        f.close()
+
+    def toggleOverlay(self):
+        self.overlay = not self.overlay
+
+    def render(self, screen):
+        # The text is only rebuilt every few frames; drawing it every frame
+        # would show up in the very numbers it displays.
+        if not self.overlay:
+            return []
+        if self.frames % self.refresh == 0 or len(self.lines) == 0:
+            self.updateLines()
+        rects = []
+        for line in self.lines:
+            rects.append(line.render(screen))
+        return rects
+
+    def updateLines(self):
+        rows = ["%-18s %6s %6s" % ("ms", "p50", "p95")]
+        for name in self.phases:
+            rows.append("%-18s %6.2f %6.2f" % (name, self.percentile(name, 50)*1000, self.percentile(name, 95)*1000))
+        while len(self.lines) < len(rows):
+            self.lines.append(Text("", GREEN, 4, 40 + 10*len(self.lines), 8))
+        del self.lines[len(rows):]
+        for i in range(len(rows)):
+            self.lines[i].setText(rows[i])
+        self.version += 1
+
+
+class NullProfiler(object):
+    """Stands in for FrameProfiler when profiling is off."""
+    overlay = False
+    version = 0
+
+    def startFrame(self):
+        pass
+
+    def mark(self, name):
+        pass
+
+    def endFrame(self):
+        pass
+
+    def toggleOverlay(self):
+        pass
+
+    def dump(self, path=None):
+        pass
+
+    def render(self, screen):
+        return []
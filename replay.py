@@ -0,0 +1,105 @@
+import json
+
+# Version 2: timers moved to the scheduler, so events land on other frames.
+RECORDINGVERSION = 2
+
+
+class InputRecorder(object):
+    """Records the input of every simulated frame of one game.
+
+    Inputs are stored run length encoded as [direction, frames] pairs, with
+    None for no key, next to the game's seed and fixed time step.
+    """
+    def __init__(self, path=None):
+        self.path = path
+        self.seed = None
+        self.dt = None
+        self.inputs = []
+        self.steps = 0
+
+    def start(self, seed, dt):
+        self.seed = seed
+        self.dt = dt
+        self.inputs = []
+        self.steps = 0
+
+    def record(self, direction):
+        if len(self.inputs) > 0 and self.inputs[-1][0] == direction:
+            self.inputs[-1][1] += 1
+        else:
+            self.inputs.append([direction, 1])
+        self.steps += 1
+
+    def getRecording(self, game=None):
+        recording = {"version":RECORDINGVERSION, "seed":self.seed, "dt":self.dt,
+                     "steps":self.steps, "inputs":self.inputs}
+        if game is not None:
+            recording["score"] = game.score
+            recording["level"] = game.level.level
+        return recording
+
+    def save(self, game=None, path=None):
+        path = path or self.path
+        if path is None:
+            return
+        f = open(path, "w")
+        json.dump(self.getRecording(game), f)
+        f.close()
+
+
+class ReplayPolicy(object):
+    """Feeds a recording's inputs back, one per simulated frame."""
+    def __init__(self, inputs):
+        self.inputs = inputs
+        self.run = 0
+        self.used = 0
+        self.finished = len(inputs) == 0
+
+    def __call__(self, game):
+        if self.finished:
+            return None
+        direction, count = self.inputs[self.run]
+        self.used += 1
+        if self.used == count:
+            self.run += 1
+            self.used = 0
+            self.finished = self.run == len(self.inputs)
+        return direction
+
+
+def loadRecording(path):
+    f = open(path, "r")
+    recording = json.load(f)
+    f.close()
+    if recording.get("version") != RECORDINGVERSION:
+        raise ValueError("unsupported recording version %s" % recording.get("version"))
+    return recording
+
+def replay(recording, game=None, maxFrames=None):
+    # Plays a recording back headless with its fixed step as fast as the
+    # simulation runs and returns the game where the recording ends.  Timed
+    # pauses are skipped over since they take no input.
+    if game is None:
+        from run import GameController
+        game = GameController(headless=True, dt=recording["dt"], fastForward=True)
+    game.dt = recording["dt"]
+    policy = ReplayPolicy(recording["inputs"])
+    game.policy = policy
+    game.startGame(recording["seed"])
+    while not game.gameover and not policy.finished:
+        if maxFrames is not None and game.frames >= maxFrames:
+            break
+        game.update(maxFrames)
+    return game
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+    recording = loadRecording(sys.argv[1])
+    start = time.perf_counter()
+    game = replay(recording)
+    elapsed = time.perf_counter() - start
+    print("frames", game.frames, "score", game.score, "level", game.level.level, "seconds", round(elapsed, 2))
+    if "score" in recording:
+        print("recorded score", recording["score"], "match", recording["score"] == game.score)
@@ -1,3 +1,5 @@
+import os
+import random
 import pygame
 from pygame.locals import *
 from constants import *
@@ -11,95 +13,256 @@ from levels import LevelController
 from text import TextGroup
 from sprites import Spritesheet
 from maze import Maze
+from collision import CollisionGrid, PELLET, GHOST, FRUIT
+from mazecache import MazeCache
+from profiler import FrameProfiler, NullProfiler
+from scheduler import Scheduler, PLAY, PAUSE, HUD
 
 class GameController(object):
-    def __init__(self):
+    def __init__(self, headless=False, dt=1.0/30, policy=None, dirtyRects=False, pathfinding=False,
+                 decisions=None, profiler=None, recorder=None, fastForward=False):
+        self.headless = headless
+        self.fastForward = fastForward
+        self.dt = dt
+        self.policy = policy
+        self.dirtyRects = dirtyRects
+        self.pathfinding = pathfinding
+        self.decisions = decisions
+        self.profiler = profiler or NullProfiler()
+        self.recorder = recorder
+        self.seed = None
+        self.random = random.Random()
+        self.fullRedraw = True
+        self.erasedRects = []
+        self.lastSprites = []
+        self.lastHud = []
+        self.hudState = None
+        if headless:
+            os.environ["SDL_VIDEODRIVER"] = "dummy"
         pygame.init()
-        self.screen = pygame.display.set_mode(SCREENSIZE, pygame.SCALED | pygame.RESIZABLE)
+        if headless:
+            self.screen = pygame.display.set_mode(SCREENSIZE)
+        else:
+            self.screen = pygame.display.set_mode(SCREENSIZE, pygame.SCALED | pygame.RESIZABLE)
         self.background = None
-        self.setBackground()
+        self.flashing = False
         self.clock = pygame.time.Clock()
+        self.frames = 0
         self.pelletsEaten = 0
         self.fruit = None
-        self.pause = Pauser(True)
+        self.fruitPool = None
+        self.collisions = CollisionGrid()
+        self.scheduler = Scheduler()
+        self.scheduler.register("fruit", self.expireFruit)
+        self.scheduler.register("flash", self.flash)
+        self.pause = Pauser(True, self.scheduler)
         self.level = LevelController()
-        self.text = TextGroup()
+        self.text = TextGroup(self.scheduler)
         self.sheet = Spritesheet()
         self.maze = Maze(self.sheet)
+        self.mazes = MazeCache()
         
-    def setBackground(self):
-        self.background = pygame.surface.Surface(SCREENSIZE).convert()
-        self.background.fill(BLACK)
+    def setBackground(self, levelmap, compiled):
+        # Pellets are drawn onto the background, so each level gets its own
+        # copy of the cached maze.
+        self.maze.setMaze(compiled.spriteInfo, compiled.rotateInfo, levelmap["mazename"].split(".")[0])
+        self.background = self.maze.getBackground().copy()
+        self.flashing = False
+        self.scheduler.cancel(PAUSE, "flash")
+        self.fullRedraw = True
+
+    def flash(self, target=None):
+        # Runs on the PAUSE timeline, so the flash stops with the level
+        # clear pause and freezes while the player pauses.
+        if self.pause.pauseType == "clear":
+            self.flashing = not self.flashing
+            self.scheduler.schedule(PAUSE, FLASHTIME, "flash")
+        else:
+            self.flashing = False
+        self.fullRedraw = True
+
+    def getBackground(self):
+        if self.flashing:
+            return self.maze.getBackground(FLASHROW)
+        return self.background
 
-    def startGame(self):
+    def startGame(self, seed=None):
+        # Every game has its own seeded generator, so a seed and the inputs
+        # are all it takes to play the same game again.
+        if seed is None:
+            seed = random.randrange(1 << 32)
+        self.seed = seed
+        self.random.seed(seed)
+        if self.recorder is not None:
+            self.recorder.start(seed, self.dt)
+        self.scheduler.reset()
+        self.text.clearTemp()
         self.level.reset()
         levelmap = self.level.getLevel()
-        self.maze.getMaze(levelmap["mazename"].split(".")[0])
-        self.maze.constructMaze(self.background)
-        self.nodes = NodeGroup(levelmap["mazename"])
-        self.pellets = PelletGroup(levelmap["pelletname"])
+        compiled = self.mazes.load(levelmap)
+        self.setBackground(levelmap, compiled)
+        self.nodes = NodeGroup(levelmap["mazename"], compiled.nodeTable)
+        self.pellets = PelletGroup(levelmap["pelletname"], compiled.pelletLayout)
+        self.pellets.setLayer(self.background)
+        self.pellets.startBlinking(self.scheduler)
         self.pacman = Pacman(self.nodes, self.sheet)
-        self.ghosts = GhostGroup(self.nodes, self.sheet)
+        self.ghosts = GhostGroup(self.nodes, self.sheet, self.pathfinding, self.decisions, self.random, self.scheduler)
         self.pelletsEaten = 0
         self.fruit = None
         self.pause.force(True)
         self.gameover = False
         self.score = 0
+        self.frames = 0
         self.text.showReady()
         self.text.updateLevel(self.level.level+1)
         
     def startLevel(self):
         levelmap = self.level.getLevel()
-        self.setBackground()
-        self.maze.getMaze(levelmap["mazename"].split(".")[0])
-        self.maze.constructMaze(self.background)
-        self.nodes = NodeGroup(levelmap["mazename"])
-        self.pellets = PelletGroup(levelmap["pelletname"])
+        compiled = self.mazes.load(levelmap)
+        self.setBackground(levelmap, compiled)
+        self.nodes = NodeGroup(levelmap["mazename"], compiled.nodeTable)
+        self.pellets = PelletGroup(levelmap["pelletname"], compiled.pelletLayout)
+        self.pellets.setLayer(self.background)
+        self.pellets.startBlinking(self.scheduler)
         self.pacman.nodes = self.nodes
         self.pacman.reset()
-        self.ghosts = GhostGroup(self.nodes, self.sheet)
+        self.ghosts.reset(self.nodes)
         self.pelletsEaten = 0
-        self.fruit = None
+        self.removeFruit()
         self.pause.force(True)
         self.text.showReady()
         self.text.updateLevel(self.level.level+1)
 
     def restartLevel(self):
         self.pacman.reset()
-        self.ghosts = GhostGroup(self.nodes, self.sheet)
-        self.fruit = None
+        self.ghosts.reset(self.nodes)
+        self.removeFruit()
         self.pause.force(True)
         self.text.showReady()
         
-    def update(self):
-        dt = self.clock.tick(30) / 1000.0
+    def update(self, maxFrames=None):
+        profiler = self.profiler
+        profiler.startFrame()
+        if self.headless:
+            dt = self.dt
+        else:
+            dt = self.clock.tick(30) / 1000.0
+            if self.recorder is not None:
+                # Recordings are replayed with a fixed step, so they have
+                # to be made with one too.
+                dt = self.dt
+        profiler.mark("wait")
+        if self.fastForward and self.pause.paused and not self.pause.playerPaused and not self.gameover:
+            # Nothing moves during a timed pause, so a fast forwarded game
+            # jumps straight to the next event on the pause timeline.  Only
+            # cosmetic animation is left behind.  With nothing on that
+            # timeline to jump to, the frame is played as usual.  The jump
+            # never runs past maxFrames.
+            limit = None if maxFrames is None else max(maxFrames - self.frames, 1)
+            steps = self.scheduler.skip(PAUSE, dt, limit)
+            if steps > 0:
+                self.frames += steps
+                profiler.mark("skip")
+                profiler.endFrame()
+                return
+        self.frames += 1
         if not self.gameover:
             if not self.pause.paused:
-                self.pacman.update(dt)
+                self.scheduler.advance(PLAY, dt)
+                profiler.mark("events.play")
+                self.pacman.update(dt, self.getInput())
+                profiler.mark("pacman.update")
                 self.ghosts.update(dt, self.pacman)
-                if self.fruit is not None:
-                    self.fruit.update(dt)
+                profiler.mark("ghosts.update")
                 if self.pause.pauseType != None:
                     self.pause.settlePause(self)
-                self.checkPelletEvents()
-                self.checkGhostEvents()
-                self.checkFruitEvents()
+                profiler.mark("pause")
+                self.checkCollisions()
+                profiler.mark("collisions")
+                if not self.headless:
+                    # Spread building the flash background over the first
+                    # frames of play so the level clear never waits on it.
+                    self.maze.prebuild(FLASHROW)
             elif self.pacman.dying:
                 self.pacman.updateAnimation(dt)
 
-            self.pause.update(dt)
-            self.pellets.update(dt)
-            self.text.update(dt)
-        self.checkEvents()
-        self.text.updateScore(self.score)
-        self.render()
+            self.scheduler.advance(PAUSE, dt)
+            self.scheduler.advance(HUD, dt)
+            profiler.mark("events.timers")
+        if self.headless:
+            self.skipPlayerPause()
+        else:
+            self.checkEvents()
+            profiler.mark("events")
+            self.render()
+        profiler.endFrame()
+
+    def run(self, maxFrames=None):
+        while not self.gameover:
+            if maxFrames is not None and self.frames >= maxFrames:
+                break
+            self.update(maxFrames)
+        return self.frames
+
+    def snapshot(self):
+        # A tuple of plain values.  Nodes are stored by index, so every
+        # snapshot shares the maze graph instead of copying it.
+        fruit = None if self.fruit is None else self.fruit.snapshot()
+        return (self.level.level, self.score, self.frames, self.pelletsEaten, self.gameover,
+                self.random.getstate(), self.pacman.snapshot(), self.ghosts.snapshot(), fruit,
+                self.pause.snapshot(), self.pellets.snapshot(), self.text.snapshot(),
+                self.flashing, self.scheduler.snapshot())
+
+    def restore(self, snapshot):
+        (level, self.score, self.frames, self.pelletsEaten, self.gameover, randomState,
+         pacman, ghosts, fruit, pause, pellets, text, self.flashing, scheduler) = snapshot
+        if level != self.level.level:
+            self.level.level = level
+            levelmap = self.level.getLevel()
+            if levelmap["mazename"] != self.nodes.level or levelmap["pelletname"] != self.pellets.pelletfile:
+                self.startLevel()
+            self.text.updateLevel(level+1)
+        self.random.setstate(randomState)
+        self.pacman.restore(pacman)
+        self.ghosts.restore(ghosts)
+        if fruit is None:
+            self.fruit = None
+        else:
+            if self.fruit is None:
+                self.fruit = self.getFruit()
+            self.fruit.restore(fruit)
+        self.pause.restore(pause)
+        self.pellets.restore(pellets)
+        self.text.restore(text)
+        self.scheduler.restore(scheduler)
+        self.fullRedraw = True
+
+    def skipPlayerPause(self):
+        if self.pause.playerPaused and not self.gameover:
+            self.pause.player()
+            self.text.hideMessages()
+
+    def getInput(self):
+        if self.policy is not None:
+            direction = self.policy(self)
+        else:
+            direction = self.pacman.getValidKey()
+        if self.recorder is not None:
+            self.recorder.record(direction)
+        return direction
 
     def checkEvents(self):
         for event in pygame.event.get():
             if event.type == QUIT:
+                if self.recorder is not None:
+                    self.recorder.save(self)
+                self.profiler.dump()
                 exit()
             elif event.type == KEYDOWN:
-                if event.key == K_SPACE:
+                if event.key == K_F3:
+                    self.profiler.toggleOverlay()
+                    self.fullRedraw = True
+                elif event.key == K_SPACE:
                     if self.gameover:
                         self.startGame()
                     else:
@@ -109,55 +272,86 @@ class GameController(object):
                         else:
                             self.text.hideMessages()
 
-    def checkPelletEvents(self):
-        pellet = self.pacman.eatPellets(self.pellets.pelletList)
-        if pellet:
-            self.pelletsEaten += 1
-            self.score += pellet.points
-            if (self.pelletsEaten == 70 or self.pelletsEaten == 140):
-                if self.fruit is None:
-                    self.fruit = Fruit(self.nodes, self.sheet)
-            self.pellets.pelletList.remove(pellet)
-            if pellet.name == "powerpellet":
-                self.ghosts.resetPoints()
-                self.ghosts.freightMode()
-            if self.pellets.isEmpty():
-                self.pacman.visible = False
-                self.ghosts.hide()
-                self.pause.startTimer(3, "clear")
-                
-    def checkGhostEvents(self):
+    def checkCollisions(self):
+        # Every contact of the frame is found in one pass and handled in a
+        # fixed order: pellets first, since they can release or frighten
+        # ghosts, then ghosts in group order, then the fruit.  Contacts left
+        # over once Pac-Man dies or the level is cleared are dropped, so
+        # nothing can replace the pause that follows.
+        contacts = self.collisions.getContacts(self.pacman, self.pellets, self.ghosts, self.fruit)
+        for kind, target in contacts:
+            if kind == PELLET:
+                self.eatPellet(target)
         self.ghosts.release(self.pelletsEaten)
-        ghost = self.pacman.eatGhost(self.ghosts)
-        if ghost is not None:
-            if ghost.mode.name == "FREIGHT":
-                self.score += ghost.points
-                self.text.createTemp(ghost.points, ghost.position)
-                self.ghosts.updatePoints()
-                ghost.spawnMode(speed=2)
-                self.pause.startTimer(1)
-                self.pacman.visible = False
-                ghost.visible = False
-            elif ghost.mode.name == "CHASE" or ghost.mode.name == "SCATTER":
-                self.pacman.die()
-                self.ghosts.hide()
-                self.pause.startTimer(3, "die")
-
-    def checkFruitEvents(self):
-        if self.fruit is not None:
-            if self.pacman.eatFruit(self.fruit):
-                self.score += self.fruit.points
-                self.text.createTemp(self.fruit.points, self.fruit.position)
-                self.fruit = None
-            elif self.fruit.destroy:
-                self.fruit = None
-            #if self.pacman.eatFruit(self.fruit) or self.fruit.destroy:
-                #self.fruit = None
+        for kind, target in contacts:
+            if self.pacman.dying or self.pellets.isEmpty():
+                break
+            if kind == GHOST:
+                self.touchGhost(target)
+            elif kind == FRUIT:
+                self.eatFruit()
+
+    def eatPellet(self, index):
+        pellet = self.pellets.removePellet(index)
+        if self.dirtyRects:
+            self.erasedRects.append(self.pellets.getPelletRect(index))
+        self.pelletsEaten += 1
+        self.score += pellet.points
+        if (self.pelletsEaten == 70 or self.pelletsEaten == 140):
+            if self.fruit is None:
+                self.fruit = self.getFruit()
+                self.scheduler.schedule(PLAY, self.fruit.lifespan, "fruit")
+        if pellet.name == "powerpellet":
+            self.ghosts.resetPoints()
+            self.ghosts.freightMode()
+        if self.pellets.isEmpty():
+            self.pacman.visible = False
+            self.ghosts.hide()
+            self.pause.startTimer(3, "clear")
+            self.scheduler.cancel(PAUSE, "flash")
+            self.scheduler.schedule(PAUSE, FLASHTIME, "flash")
+                
+    def touchGhost(self, ghost):
+        if ghost.mode.name == "FREIGHT":
+            self.score += ghost.points
+            self.text.createTemp(ghost.points, ghost.position)
+            self.ghosts.updatePoints()
+            ghost.spawnMode(speed=2)
+            self.pause.startTimer(1)
+            self.pacman.visible = False
+            ghost.visible = False
+        elif ghost.mode.name == "CHASE" or ghost.mode.name == "SCATTER":
+            self.pacman.die()
+            self.ghosts.hide()
+            self.pause.startTimer(3, "die")
+
+    def getFruit(self):
+        # Only one fruit is ever on screen, so the same object is handed out
+        # again each time instead of building a new one.
+        if self.fruitPool is None:
+            self.fruitPool = Fruit(self.nodes, self.sheet)
+        else:
+            self.fruitPool.reset(self.nodes)
+        return self.fruitPool
+
+    def eatFruit(self):
+        self.score += self.fruit.points
+        self.text.createTemp(self.fruit.points, self.fruit.position)
+        self.removeFruit()
+
+    def expireFruit(self, target=None):
+        self.fruit = None
+
+    def removeFruit(self):
+        self.fruit = None
+        self.scheduler.cancel(PLAY, "fruit")
 
     def resolveDeath(self):
         if self.pacman.lives == 0:
             self.gameover = True
             self.text.showGameOver()
+            if self.recorder is not None:
+                self.recorder.save(self)
         else:
             self.restartLevel()
         self.pause.pauseType = None
@@ -168,20 +362,90 @@ class GameController(object):
         self.pause.pauseType = None
     
     def render(self):
-        self.screen.blit(self.background, (0, 0))
+        profiler = self.profiler
+        self.text.updateScore(self.score)
+        profiler.mark("render.score")
+        if self.dirtyRects:
+            self.renderDirty()
+            return
+        self.screen.blit(self.getBackground(), (0, 0))
+        profiler.mark("render.background")
         #self.nodes.render(self.screen)
         self.pellets.render(self.screen)
+        profiler.mark("render.pellets")
         if self.fruit is not None:
             self.fruit.render(self.screen)
+        profiler.mark("render.fruit")
         self.pacman.render(self.screen)
+        profiler.mark("render.pacman")
         self.ghosts.render(self.screen)
+        profiler.mark("render.ghosts")
         self.pacman.renderLives(self.screen)
         self.text.render(self.screen)
+        profiler.render(self.screen)
+        profiler.mark("render.hud")
         pygame.display.update()
+        profiler.mark("render.display")
+
+    def renderDirty(self):
+        # Only the regions that can change are restored from the background
+        # and sent to the display.  HUD items are redrawn every frame so that
+        # sprites passing over them never leave holes, but their rects are
+        # only uploaded when the HUD actually changed.
+        screen = self.screen
+        profiler = self.profiler
+        background = self.getBackground()
+        if self.fullRedraw:
+            screen.blit(background, (0, 0))
+        else:
+            for rect in self.lastSprites + self.lastHud + self.erasedRects:
+                screen.blit(background, rect, rect)
+        profiler.mark("render.background")
+        sprites = self.pellets.render(screen)
+        profiler.mark("render.pellets")
+        if self.fruit is not None:
+            sprites.append(self.fruit.render(screen))
+        profiler.mark("render.fruit")
+        sprites.append(self.pacman.render(screen))
+        profiler.mark("render.pacman")
+        sprites += self.ghosts.render(screen)
+        profiler.mark("render.ghosts")
+        sprites = [rect for rect in sprites if rect is not None]
+        hud = self.pacman.renderLives(screen) + self.text.render(screen) + profiler.render(screen)
+        hud = [rect for rect in hud if rect is not None]
+        hudState = (self.pacman.lives, self.text.getState(), profiler.overlay, profiler.version)
+        profiler.mark("render.hud")
+        if self.fullRedraw:
+            pygame.display.update()
+            self.fullRedraw = False
+        else:
+            dirty = self.lastSprites + self.erasedRects + sprites
+            if hudState != self.hudState:
+                dirty += self.lastHud + hud
+            pygame.display.update(dirty)
+        self.lastSprites = sprites
+        self.lastHud = hud
+        self.hudState = hudState
+        self.erasedRects = []
+        profiler.mark("render.display")
 
 
 if __name__ == "__main__":
-    game = GameController()
+    import argparse
+    parser = argparse.ArgumentParser(description="Pacman")
+    parser.add_argument("--record", metavar="FILE", help="record the session's input to this file")
+    parser.add_argument("--profile", nargs="?", const="profile.json", metavar="FILE",
+                        help="time each frame, F3 shows the overlay, and write a summary "
+                             "to FILE on quit (default profile.json)")
+    args = parser.parse_args()
+    recorder = None
+    if args.record:
+        from replay import InputRecorder
+        recorder = InputRecorder(args.record)
+    profiler = None
+    if args.profile:
+        profiler = FrameProfiler(path=args.profile)
+    game = GameController(profiler=profiler, recorder=recorder)
     game.startGame()
     while True:
         game.update()
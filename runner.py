@@ -0,0 +1,98 @@
+import os
+import sys
+import random
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from constants import *
+
+GameRecord = namedtuple("GameRecord", ["seed", "score", "level", "deaths", "frames"])
+
+STARTLIVES = 5
+
+
+class RandomPolicy(object):
+    """Holds a random direction for a few frames at a time."""
+    def __init__(self, seed=None, interval=15):
+        self.random = random.Random(seed)
+        self.interval = interval
+        self.direction = None
+        self.frame = 0
+
+    def __call__(self, game):
+        if self.frame % self.interval == 0:
+            self.direction = self.random.choice([UP, DOWN, LEFT, RIGHT, None])
+        self.frame += 1
+        return self.direction
+
+
+# Each worker process keeps one headless game and reuses it for every game it
+# is handed, so the pygame setup only happens once per process.
+workerGame = None
+
+def getWorkerGame():
+    global workerGame
+    if workerGame is None:
+        from run import GameController
+        workerGame = GameController(headless=True, fastForward=True)
+    return workerGame
+
+def playGame(seed, policyFactory=RandomPolicy, maxFrames=None):
+    game = getWorkerGame()
+    game.policy = policyFactory(seed)
+    game.startGame(seed)
+    game.run(maxFrames)
+    return GameRecord(seed, game.score, game.level.level, STARTLIVES - game.pacman.lives, game.frames)
+
+def playGames(args):
+    seeds, policyFactory, maxFrames = args
+    return [playGame(seed, policyFactory, maxFrames) for seed in seeds]
+
+
+class GameRunner(object):
+    """Plays independent headless games on a pool of worker processes."""
+    def __init__(self, policyFactory=RandomPolicy, workers=None, maxFrames=None):
+        self.policyFactory = policyFactory
+        self.workers = workers or os.cpu_count() or 1
+        self.maxFrames = maxFrames
+
+    def run(self, seeds):
+        seeds = list(seeds)
+        chunks = self.split(seeds)
+        records = []
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            jobs = [(chunk, self.policyFactory, self.maxFrames) for chunk in chunks]
+            for chunkRecords in executor.map(playGames, jobs):
+                records += chunkRecords
+        return records
+
+    def split(self, seeds):
+        # A few chunks per worker keeps the pool busy without sending one
+        # task per game across the process boundary.
+        size = max(1, len(seeds) // (self.workers * 4))
+        return [seeds[i:i+size] for i in range(0, len(seeds), size)]
+
+
+def aggregate(records):
+    games = len(records)
+    if games == 0:
+        return {"games":0}
+    scores = [r.score for r in records]
+    return {"games":games,
+            "frames":sum(r.frames for r in records),
+            "meanScore":sum(scores) / float(games),
+            "maxScore":max(scores),
+            "meanLevel":sum(r.level for r in records) / float(games),
+            "meanDeaths":sum(r.deaths for r in records) / float(games)}
+
+
+if __name__ == "__main__":
+    import time
+    numGames = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else None
+    runner = GameRunner(workers=workers)
+    start = time.perf_counter()
+    results = aggregate(runner.run(range(numGames)))
+    elapsed = time.perf_counter() - start
+    for key in results.keys():
+        print(key, results[key])
+    print("seconds", round(elapsed, 2), "frames/s", int(results.get("frames", 0) / elapsed))
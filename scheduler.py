@@ -0,0 +1,111 @@
+import heapq
+
+# Timelines, each with a clock of its own.  PLAY only runs while the game is
+# being played, PAUSE only while a timed pause counts down and HUD until the
+# game is over.
+PLAY = 0
+PAUSE = 1
+HUD = 2
+GROUPS = (PLAY, PAUSE, HUD)
+
+
+class Scheduler(object):
+    """Per game timeline of everything that happens after a delay.
+
+    Every group keeps a heap of (due, order, name, target) events against its
+    own clock, and a group that is suspended simply stops its clock.  Events
+    name a handler registered with register instead of holding a callback,
+    so the pending events are plain tuples that snapshot like the rest of
+    the game.
+    """
+    def __init__(self):
+        self.handlers = {}
+        self.reset()
+
+    def reset(self):
+        self.clocks = [0.0 for group in GROUPS]
+        self.queues = [[] for group in GROUPS]
+        self.running = [True for group in GROUPS]
+        self.order = 0
+
+    def register(self, name, handler):
+        self.handlers[name] = handler
+
+    def now(self, group):
+        return self.clocks[group]
+
+    def schedule(self, group, delay, name, target=None):
+        self.scheduleAt(group, self.clocks[group] + delay, name, target)
+
+    def scheduleAt(self, group, due, name, target=None):
+        self.order += 1
+        heapq.heappush(self.queues[group], (due, self.order, name, target))
+
+    def cancel(self, group, name, target=None):
+        queue = self.queues[group]
+        kept = [event for event in queue if event[2] != name or event[3] != target]
+        if len(kept) != len(queue):
+            queue[:] = kept
+            heapq.heapify(queue)
+
+    def suspend(self, group):
+        self.running[group] = False
+
+    def resume(self, group):
+        self.running[group] = True
+
+    def advance(self, group, dt, steps=1):
+        # Moves a running group's clock on by steps frames of dt and fires
+        # whatever has come due, earliest first.  Handlers may schedule more
+        # events, and any that are already due fire in the same call.
+        if not self.running[group]:
+            return
+        clock = self.clocks[group]
+        for step in range(steps):
+            clock += dt
+        self.clocks[group] = clock
+        queue = self.queues[group]
+        while len(queue) > 0 and queue[0][0] <= clock:
+            due, order, name, target = heapq.heappop(queue)
+            self.handlers[name](target)
+
+    def skip(self, group, dt, limit=None):
+        """Jumps straight to the frame on which group's next event fires.
+
+        The number of frames is worked out from the event's due time and
+        every running group is moved on by all but the last of them at once,
+        then by the last one the way a played frame would, so group's event
+        fires in the same order relative to the others.  Clocks are summed
+        one dt per frame rather than multiplied, so they come out exactly as
+        if every frame had been played.  At most limit frames are skipped.
+        Returns the number of frames, 0 when group is suspended or has
+        nothing pending.
+        """
+        queue = self.queues[group]
+        if not self.running[group] or len(queue) == 0:
+            return 0
+        due = queue[0][0]
+        clock = self.clocks[group]
+        steps = 0
+        while limit is None or steps < limit:
+            clock += dt
+            steps += 1
+            if clock >= due:
+                break
+        if steps == 0:
+            return 0
+        for other in GROUPS:
+            self.advance(other, dt, steps-1)
+        for other in GROUPS:
+            self.advance(other, dt)
+        return steps
+
+    def snapshot(self):
+        return (tuple(self.clocks), tuple(self.running),
+                tuple(tuple(queue) for queue in self.queues), self.order)
+
+    def restore(self, state):
+        clocks, running, queues, self.order = state
+        self.clocks = list(clocks)
+        self.running = list(running)
+        self.queues = [list(queue) for queue in queues]
@@ -2,12 +2,26 @@ import pygame
 from constants import *
 
 class Spritesheet(object):
+    """The sprite sheet and every frame cut from it.
+
+    The sheet is loaded once per process and each (col, row, size, scale)
+    frame is cut, and scaled if asked, the first time it is requested.  All
+    later requests, from any game, get the same Surface back.
+    """
+    sheet = None
+    images = {}
+
     def __init__(self): 
-        self.sheet = pygame.image.load("spritesheet.png").convert()
-        self.sheet.set_colorkey(TRANSPARENT)
+        if Spritesheet.sheet is None:
+            Spritesheet.sheet = pygame.image.load("spritesheet.png").convert()
+            Spritesheet.sheet.set_colorkey(TRANSPARENT)
         
-    def getImage(self, x, y, width, height):
-        x *= width
-        y *= height
-        self.sheet.set_clip(pygame.Rect(x, y, width, height))
-        return self.sheet.subsurface(self.sheet.get_clip())
+    def getImage(self, x, y, width, height, scale=None):
+        key = (x, y, width, height, scale)
+        image = self.images.get(key)
+        if image is None:
+            image = self.sheet.subsurface(pygame.Rect(x*width, y*height, width, height))
+            if scale is not None:
+                image = pygame.transform.scale(image, scale)
+            self.images[key] = image
+        return image
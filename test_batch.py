@@ -0,0 +1,45 @@
+import random
+from constants import *
+from run import GameController
+from batch import BatchEngine, FREIGHT
+
+
+def playBoth(seed, frames):
+    # Plays one game in each engine with the same seed and the same
+    # scripted keys, and checks they agree on every frame.
+    script = random.Random(seed)
+    game = GameController(headless=True)
+    game.startGame(seed)
+    batch = BatchEngine(1)
+    batch.reset(seeds=[seed])
+    key = [STOP]
+    game.pacman.getValidKey = lambda: None if key[0] == STOP else key[0]
+    freight = 0
+    for frame in range(frames):
+        if game.gameover:
+            break
+        if frame % 11 == 0:
+            key[0] = script.choice([UP, DOWN, LEFT, RIGHT, STOP, STOP])
+        game.update()
+        batch.step([key[0]])
+        ghosts = [ghost.position.asTuple() for ghost in game.ghosts]
+        assert tuple(batch.pacmanPosition[0]) == game.pacman.position.asTuple(), frame
+        assert [tuple(p) for p in batch.ghostPosition[0]] == ghosts, frame
+        assert batch.score[0] == game.score, frame
+        assert batch.lives[0] == game.pacman.lives, frame
+        freight += (batch.mode[0] == FREIGHT).any()
+    assert batch.gameover[0] == game.gameover
+    return freight
+
+
+def test_batch_matches_game_through_freight():
+    for seed in (2, 4):
+        assert playBoth(seed, 3000) > 0
+
+
+def test_reset_seeds_each_game():
+    batch = BatchEngine(3, seed=5)
+    batch.reset(seeds=[7, 7, 8])
+    draws = [rng.random() for rng in batch.randoms]
+    assert draws[0] == draws[1]
+    assert draws[0] != draws[2]
@@ -0,0 +1,41 @@
+from vector import Vector2
+from run import GameController
+
+
+def startCleared():
+    # Leaves a single normal pellet with Pac-Man on top of it.
+    game = GameController(headless=True)
+    game.startGame(1)
+    pellets = game.pellets
+    layout = pellets.layout
+    last = [index for index in layout.indices if not layout.power[index]][0]
+    for index in layout.indices:
+        if index != last:
+            pellets.removePellet(index)
+    x, y = layout.getPosition(last)
+    game.pacman.position = Vector2(x, y)
+    return game
+
+
+def test_frightened_ghost_does_not_cancel_level_clear():
+    game = startCleared()
+    ghost = game.ghosts.byName["blinky"]
+    ghost.freightMode()
+    ghost.position = game.pacman.position.copy()
+    score = game.score
+    game.checkCollisions()
+    assert game.pellets.isEmpty()
+    assert game.pause.pauseType == "clear"
+    assert game.score == score + 10
+    assert ghost.mode.name == "FREIGHT"
+
+
+def test_ghost_does_not_kill_after_level_clear():
+    game = startCleared()
+    ghost = game.ghosts.byName["blinky"]
+    ghost.position = game.pacman.position.copy()
+    lives = game.pacman.lives
+    game.checkCollisions()
+    assert game.pause.pauseType == "clear"
+    assert not game.pacman.dying
+    assert game.pacman.lives == lives
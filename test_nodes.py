@@ -0,0 +1,24 @@
+import itertools
+from nodes import NodeGroup
+from ghosts import GhostGroup
+from run import GameController
+
+
+def test_path_direction_matches_cost_scan():
+    nodes = NodeGroup("maze1.txt")
+    nodes.computePaths()
+    for source in nodes.allNodes:
+        for goal in nodes.allNodes:
+            costs = nodes.getPathCosts(source.index, goal.index)
+            for size in range(1, 5):
+                for valid in itertools.combinations(range(4), size):
+                    best = min(valid, key=lambda direction: costs[direction])
+                    assert nodes.getPathDirection(source, goal, list(valid)) == best
+
+
+def test_pathfinding_ghosts_compute_paths_at_load():
+    game = GameController(headless=True)
+    nodes = NodeGroup("maze1.txt")
+    assert nodes.distances is None
+    GhostGroup(nodes, game.sheet, pathfinding=True)
+    assert nodes.nextHop is not None
@@ -0,0 +1,84 @@
+from scheduler import Scheduler, PAUSE, HUD
+from run import GameController
+from runner import RandomPolicy
+
+
+def pausedGame():
+    # A fast forwarded game stuck in a timed pause with nothing due on the
+    # pause timeline.
+    game = GameController(headless=True, fastForward=True)
+    game.startGame(1)
+    game.update()
+    game.pause.startTimer(1)
+    game.scheduler.cancel(PAUSE, "unpause")
+    return game
+
+
+def test_skip_stops_at_next_event():
+    scheduler = Scheduler()
+    fired = []
+    scheduler.register("event", fired.append)
+    scheduler.schedule(PAUSE, 0.5, "event", "done")
+    assert scheduler.skip(PAUSE, 0.1) == 5
+    assert fired == ["done"]
+    assert scheduler.now(HUD) == scheduler.now(PAUSE)
+
+
+def test_skip_stops_at_limit():
+    scheduler = Scheduler()
+    fired = []
+    scheduler.register("event", fired.append)
+    scheduler.schedule(PAUSE, 0.5, "event", "done")
+    assert scheduler.skip(PAUSE, 0.1, 3) == 3
+    assert fired == []
+    assert scheduler.now(PAUSE) == 0.1 + 0.1 + 0.1
+    assert scheduler.skip(PAUSE, 0.1, 3) == 2
+    assert fired == ["done"]
+
+
+def test_skip_fires_earlier_events_of_other_groups_first():
+    scheduler = Scheduler()
+    fired = []
+    scheduler.register("event", fired.append)
+    scheduler.schedule(PAUSE, 0.5, "event", "pause")
+    scheduler.schedule(HUD, 0.2, "event", "hud")
+    assert scheduler.skip(PAUSE, 0.1) == 5
+    assert fired == ["hud", "pause"]
+
+
+def test_skip_without_events_returns_zero():
+    scheduler = Scheduler()
+    assert scheduler.skip(PAUSE, 0.1) == 0
+    scheduler.register("event", lambda target: None)
+    scheduler.schedule(PAUSE, 0.5, "event")
+    scheduler.suspend(PAUSE)
+    assert scheduler.skip(PAUSE, 0.1) == 0
+
+
+def test_fast_forward_plays_a_frame_when_nothing_is_due():
+    game = pausedGame()
+    frames = game.frames
+    game.update()
+    assert game.frames == frames + 1
+    assert game.run(maxFrames=frames + 10) == frames + 10
+
+
+def test_fast_forward_run_keeps_to_max_frames():
+    whole = GameController(headless=True, fastForward=True, policy=RandomPolicy(1))
+    whole.startGame(1)
+    whole.run()
+    game = GameController(headless=True, fastForward=True, policy=RandomPolicy(1))
+    game.startGame(1)
+    while not game.gameover:
+        budget = game.frames + 7
+        assert game.run(maxFrames=budget) <= budget
+    assert (game.frames, game.score) == (whole.frames, whole.score)
+
+
+def test_fast_forward_plays_a_frame_when_pause_is_suspended():
+    game = pausedGame()
+    game.scheduler.schedule(PAUSE, 1, "unpause")
+    game.scheduler.suspend(PAUSE)
+    frames = game.frames
+    game.update()
+    assert game.frames == frames + 1
@@ -1,8 +1,49 @@
 import pygame
 from vector import Vector2
 from constants import *
+from scheduler import Scheduler, HUD
+
+FONTPATH = "PressStart2P-Regular.ttf"
+
+class GlyphAtlas(object):
+    """Renders each character once per (size, color) and builds strings
+    by copying those glyphs side by side.
+
+    Fonts and glyphs live in class level dicts, so every Text in a process
+    shares them.  The font is monospaced and glyphs never overlap, so a
+    composed label matches what the font would render for the whole string.
+    """
+    fonts = {}
+    glyphs = {}
+
+    def getFont(self, size):
+        if size not in self.fonts:
+            self.fonts[size] = pygame.font.Font(FONTPATH, size)
+        return self.fonts[size]
+
+    def getGlyph(self, char, size, color):
+        key = (char, size, color)
+        if key not in self.glyphs:
+            self.glyphs[key] = self.getFont(size).render(char, 1, color)
+        return self.glyphs[key]
+
+    def render(self, text, size, color):
+        glyphs = [self.getGlyph(char, size, color) for char in text]
+        width = sum(glyph.get_width() for glyph in glyphs)
+        height = self.getFont(size).get_height()
+        label = pygame.Surface((width, height), pygame.SRCALPHA)
+        x = 0
+        for glyph in glyphs:
+            # MAX onto the cleared surface copies the glyph, alpha included,
+            # where a normal blit would blend it against nothing.
+            label.blit(glyph, (x, 0), special_flags=pygame.BLEND_RGBA_MAX)
+            x += glyph.get_width()
+        return label
+
 
 class Text(object):
+    atlas = GlyphAtlas()
+
     def __init__(self, text, color, x, y, size, show=True):
         self.text = text
         self.color = color
@@ -10,43 +51,37 @@ class Text(object):
         self.position = Vector2(x, y)
         self.show = show
         self.label = None
-        self.font = None
-        self.totalTime = 0
-        self.lifespan = 0
-        self.setupFont("PressStart2P-Regular.ttf")
         self.createLabel()
         
-    def setupFont(self, fontpath):
-        self.font = pygame.font.Font(fontpath, self.size)
-        
     def createLabel(self):
-        self.label = self.font.render(self.text, 1, self.color)
+        self.label = self.atlas.render(self.text, self.size, self.color)
     
     def setText(self, newtext):
-        self.text = newtext
-        self.createLabel()
+        # Labels are only rebuilt when the text actually changes.
+        if newtext != self.text:
+            self.text = newtext
+            self.createLabel()
         
-    def update(self, dt):
-        if self.lifespan > 0:
-            self.totalTime += dt
-            if self.totalTime >= self.lifespan:
-                self.totalTime = 0
-                self.show = False
-                self.lifespan = 0
-                
     def render(self, screen):
         if self.show:
             x, y = self.position.asTuple()
-            screen.blit(self.label, (x, y))
+            return screen.blit(self.label, (x, y))
+        return None
 
 
 
 
 class TextGroup(object):
-    def __init__(self):
+    def __init__(self, scheduler=None):
+        if scheduler is None:
+            scheduler = Scheduler()
+        self.scheduler = scheduler
+        self.scheduler.register("popup", self.expireTemp)
         self.textlist = {}
         self.setupText()
         self.tempText = []
+        self.tempPool = []
+        self.tempLifespan = 1
         
     def setupText(self):
         self.textlist["score_label"] = Text("SCORE", WHITE, 0, 0, 16)
@@ -57,14 +92,14 @@ class TextGroup(object):
         self.textlist["paused"] = Text("PAUSED!", YELLOW, 170, 320, 16, False)
         self.textlist["gameover"] = Text("GAMEOVER!", RED, 160, 320, 16, False)
         
-    def update(self, dt):
-        if len(self.tempText) > 0:
-            tempText = []
-            for text in self.tempText:
-                text.update(dt)
-                if text.show:
-                    tempText.append(text)
-            self.tempText = tempText
+    def clearTemp(self):
+        self.tempPool += self.tempText
+        self.tempText = []
+
+    def expireTemp(self, target=None):
+        # Every popup lives as long as the others, so the one a "popup"
+        # event ends is always the oldest.
+        self.tempPool.append(self.tempText.pop(0))
             
     def updateScore(self, score):
         self.textlist["score"].setText(str(score).zfill(8))
@@ -94,13 +129,48 @@ class TextGroup(object):
         
     def createTemp(self, value, position):
         x, y = position.asTuple()
-        text = Text(str(value), WHITE, x, y, 8)
-        text.lifespan = 1
-        self.tempText.append(text)
+        self.tempText.append(self.getTemp(str(value), x, y))
+        self.scheduler.schedule(HUD, self.tempLifespan, "popup")
+
+    def getTemp(self, value, x, y):
+        # Popups are reused from a pool once they expire.  A reused one only
+        # renders a new label when its value is different.
+        if len(self.tempPool) > 0:
+            text = self.tempPool.pop()
+            text.setText(value)
+            text.position.set(x, y)
+        else:
+            text = Text(value, WHITE, x, y, 8)
+        return text
         
+    def snapshot(self):
+        messages = tuple(self.textlist[key].show for key in ("ready", "paused", "gameover"))
+        temps = tuple((text.text, text.position.x, text.position.y) for text in self.tempText)
+        return (messages, temps)
+
+    def restore(self, state):
+        messages, temps = state
+        for key, show in zip(("ready", "paused", "gameover"), messages):
+            self.textlist[key].show = show
+        # Popups are rare, so they are only rebuilt when they differ.  Their
+        # expiry events come back with the scheduler.
+        current = tuple((text.text, text.position.x, text.position.y) for text in self.tempText)
+        if current != temps:
+            self.tempPool += self.tempText
+            self.tempText = []
+            for value, x, y in temps:
+                self.tempText.append(self.getTemp(value, x, y))
+
+    def getState(self):
+        state = [(text.text, text.show) for text in self.textlist.values()]
+        state += [(text.text, text.position.asTuple()) for text in self.tempText]
+        return state
+
     def render(self, screen):
+        rects = []
         for key in self.textlist.keys():
-            self.textlist[key].render(screen)
+            rects.append(self.textlist[key].render(screen))
             
         for item in self.tempText:
-            item.render(screen)
+            rects.append(item.render(screen))
+        return rects
@@ -1,10 +1,12 @@
 from math import sqrt
 
 class Vector2(object):
+    __slots__ = ("x", "y")
+    thresh = 0.000001
+
     def __init__(self, x=0, y=0):
         self.x = x
         self.y = y
-        self.thresh = 0.000001
 
     def __str__(self):
         return "<"+str(self.x)+", "+str(self.y)+">"
@@ -15,6 +17,24 @@ class Vector2(object):
     def __sub__(self, other):
         return Vector2(self.x - other.x, self.y - other.y)
 
+    # The in place operators change this vector instead of building a new
+    # one, so never use them on a vector that is shared, such as a node's
+    # position or one of the direction constants.
+    def __iadd__(self, other):
+        self.x += other.x
+        self.y += other.y
+        return self
+
+    def __isub__(self, other):
+        self.x -= other.x
+        self.y -= other.y
+        return self
+
+    def __imul__(self, scalar):
+        self.x *= scalar
+        self.y *= scalar
+        return self
+
     def __neg__(self):
         return Vector2(-self.x, -self.y)
 
@@ -41,6 +61,19 @@ class Vector2(object):
     def magnitudeSquared(self):
         return self.x**2 + self.y**2
 
+    def distanceSquared(self, other):
+        dx = self.x - other.x
+        dy = self.y - other.y
+        return dx*dx + dy*dy
+
+    def set(self, x, y):
+        self.x = x
+        self.y = y
+
+    def addScaled(self, other, scalar):
+        self.x += other.x * scalar
+        self.y += other.y * scalar
+
     def magnitude(self):
         return sqrt(self.magnitudeSquared())
 